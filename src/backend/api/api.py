@@ -4,6 +4,7 @@ API endpoints for tGPT
 This module provides a RESTful API for the tGPT backend services.
 """
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import json
@@ -17,7 +18,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from search_assistant.search_service import SearchService
 from data_generator.generator_service import DataGeneratorService
 from meeting_summarizer.summarizer_service import MeetingSummarizerService
+from meeting_summarizer.audio_windows import spool_upload
 from nfr_assistant.nfr_service import NFRService
+from common.executors import PoolFullError, bounded_executor
+from common.model_registry import registry, shared_embedding_batcher, MODEL_PRELOAD
+from common.job_queue import JobQueue
+from common import confluence_client
+from common.confluence_publisher import ConfluencePublisher
 
 app = FastAPI(title="tGPT API", description="Team Guidance and Productive Tool API")
 
@@ -26,6 +33,39 @@ search_service = SearchService()
 data_generator_service = DataGeneratorService()
 meeting_summarizer_service = MeetingSummarizerService()
 nfr_service = NFRService()
+confluence_publisher = ConfluencePublisher()
+
+# Blocking model, index and HTTP work runs on these pools so the event loop stays responsive;
+# a full pool answers 503 instead of queueing without bound
+search_pool = bounded_executor("search", max_workers=4, max_queue=32)
+sync_pool = bounded_executor("search-sync", max_workers=1, max_queue=2)
+generator_pool = bounded_executor("generator", max_workers=2, max_queue=16)
+meeting_pool = bounded_executor("meeting", max_workers=1, max_queue=4)
+nfr_pool = bounded_executor("nfr", max_workers=2, max_queue=16)
+document_pool = bounded_executor("documents", max_workers=2, max_queue=16)
+confluence_pool = bounded_executor("confluence", max_workers=4, max_queue=16)
+pools = [search_pool, sync_pool, generator_pool, meeting_pool, nfr_pool, document_pool, confluence_pool]
+
+# Long transcriptions and summaries run as persistent background jobs
+job_queue = JobQueue()
+upload_dir = os.path.join(job_queue.jobs_dir, "uploads") if job_queue.jobs_dir else None
+if upload_dir:
+    os.makedirs(upload_dir, exist_ok=True)
+
+def _transcribe_job(payload, job):
+    def on_partial(event):
+        job.set_progress({"transcribed_seconds": event["end"]})
+    return meeting_summarizer_service.transcribe_file(payload["audio_path"], on_partial, job.check_cancelled)
+
+def _summarize_job(payload, job):
+    return meeting_summarizer_service.summarize_text(payload["text"], payload["max_length"], payload["min_length"])
+
+def _delete_job_audio(payload):
+    if os.path.exists(payload["audio_path"]):
+        os.unlink(payload["audio_path"])
+
+job_queue.register("transcribe", _transcribe_job, cleanup=_delete_job_audio)
+job_queue.register("summarize", _summarize_job)
 
 # Models for request/response
 class SearchQuery(BaseModel):
@@ -34,10 +74,19 @@ class SearchQuery(BaseModel):
     space_key: str
     auth_token: str
     top_k: int = 5
+    parallelism: Optional[int] = None
+    incremental: bool = True
+    mode: Optional[str] = None
+    fusion: Optional[str] = None
+    alpha: Optional[float] = None
 
 class QuestionRequest(BaseModel):
     question: str
-    context: str
+    # Without a context the server retrieves passages from the index
+    context: Optional[str] = None
+    top_k: Optional[int] = None
+    # 1 decodes greedily; defaults to QA_NUM_BEAMS
+    num_beams: Optional[int] = None
 
 class TemplateRequest(BaseModel):
     template_id: str
@@ -47,12 +96,45 @@ class TemplateRequest(BaseModel):
 class GenerateDataRequest(BaseModel):
     template_id: str
     count: int = 1
+    # faker | pooled
+    mode: str = "faker"
+    # Distinct values per field in pooled mode (GENERATOR_POOL_CARDINALITY by default)
+    cardinality: Optional[int] = None
+    # False returns XML records validated but not indented
+    pretty: bool = True
+
+class StreamDataRequest(GenerateDataRequest):
+    # ndjson | json | xml
+    format: str = "ndjson"
+
+class BulkGenerateRequest(BaseModel):
+    template_id: str
+    count: int = 1
+    # ndjson | json | xml
+    format: str = "ndjson"
+    # Same seed, template, count and format give the same output
+    seed: Optional[int] = None
+    # Written under GENERATOR_OUTPUT_DIR when set, streamed otherwise
+    output_file: Optional[str] = None
 
 class ConfluenceUploadRequest(BaseModel):
     page_id: str
     base_url: str
     auth_token: str
 
+class PublishItem(BaseModel):
+    page_id: str
+    markdown_content: str
+
+class BulkPublishRequest(BaseModel):
+    base_url: str
+    auth_token: str
+    items: List[PublishItem]
+    # Title for pages that have none
+    default_title: str = "Published Document"
+    # Uploads in flight at once, up to CONFLUENCE_PUBLISH_CONCURRENCY
+    max_concurrency: Optional[int] = None
+
 class MeetingData(BaseModel):
     title: str
     date: str
@@ -69,15 +151,36 @@ class NFRData(BaseModel):
     requirements: Dict[str, List[Dict[str, Any]]]
     audit_trail: Optional[List[Dict[str, str]]] = None
 
+def _sse(events):
+    """Format event dicts as server-sent events"""
+    for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+@app.exception_handler(PoolFullError)
+async def pool_full_handler(request, exc: PoolFullError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.on_event("startup")
+async def start_background_work():
+    registry.preload(MODEL_PRELOAD)
+    job_queue.start()
+
 # API Routes
 
 # Search Assistant Routes
 @app.post("/search/fetch-pages")
 async def fetch_confluence_pages(request: SearchQuery):
-    result = search_service.fetch_confluence_pages(
+    result = await sync_pool.run(
+        search_service.fetch_confluence_pages,
         request.base_url, 
         request.space_key, 
-        request.auth_token
+        request.auth_token,
+        request.parallelism,
+        request.incremental
     )
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
@@ -85,22 +188,45 @@ async def fetch_confluence_pages(request: SearchQuery):
 
 @app.post("/search/query")
 async def search_pages(request: SearchQuery):
-    result = search_service.search(request.query, request.top_k)
+    result = await search_pool.run(
+        search_service.search,
+        request.query,
+        request.top_k,
+        request.mode,
+        request.fusion,
+        request.alpha
+    )
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+@app.get("/search/stats")
+async def search_stats():
+    return await search_pool.run(search_service.get_stats)
+
 @app.post("/search/answer")
 async def answer_question(request: QuestionRequest):
-    result = search_service.answer_question(request.question, request.context)
+    result = await search_pool.run(
+        search_service.answer_question,
+        request.question,
+        request.context,
+        request.top_k,
+        request.num_beams
+    )
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+@app.post("/search/answer/stream")
+async def stream_answer(request: QuestionRequest):
+    events = search_service.answer_question_stream(request.question, request.context, request.top_k)
+    return StreamingResponse(search_pool.stream(_sse(events)), media_type="text/event-stream")
+
 # Data Generator Routes
 @app.post("/generator/load-template")
 async def load_template(request: TemplateRequest):
-    result = data_generator_service.load_template(
+    result = await generator_pool.run(
+        data_generator_service.load_template,
         request.template_id, 
         request.template_content,
         request.template_type
@@ -109,13 +235,63 @@ async def load_template(request: TemplateRequest):
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+@app.get("/generator/templates")
+async def list_templates():
+    return await generator_pool.run(data_generator_service.list_templates)
+
+@app.get("/generator/templates/stats")
+async def template_stats():
+    return await generator_pool.run(data_generator_service.get_template_stats)
+
+@app.get("/generator/templates/{template_id}")
+async def get_template(template_id: str, version: Optional[int] = None):
+    result = await generator_pool.run(data_generator_service.get_template, template_id, version)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
+@app.delete("/generator/templates/{template_id}")
+async def delete_template(template_id: str):
+    result = await generator_pool.run(data_generator_service.delete_template, template_id)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
 @app.post("/generator/generate")
 async def generate_data(request: GenerateDataRequest):
-    result = data_generator_service.generate_data(request.template_id, request.count)
+    result = await generator_pool.run(
+        data_generator_service.generate_data, request.template_id, request.count, request.mode, request.cardinality, request.pretty
+    )
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+@app.post("/generator/generate/stream")
+async def stream_generated_data(request: StreamDataRequest):
+    result = await generator_pool.run(
+        data_generator_service.stream_data,
+        request.template_id, request.count, request.format, request.mode, request.cardinality, request.pretty
+    )
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result["message"])
+    return StreamingResponse(generator_pool.stream(result["stream"]), media_type=result["media_type"])
+
+@app.post("/generator/generate/bulk")
+async def bulk_generate_data(request: BulkGenerateRequest):
+    result = await generator_pool.run(
+        data_generator_service.bulk_generate,
+        request.template_id, request.count, request.format, request.seed, request.output_file
+    )
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result["message"])
+    if request.output_file:
+        return result
+    return StreamingResponse(
+        generator_pool.stream(result["stream"]),
+        media_type=result["media_type"],
+        headers={"X-Generator-Seed": str(result["seed"])}
+    )
+
 @app.post("/generator/upload-to-confluence")
 async def upload_generator_output(
     content: str = Form(...),
@@ -132,7 +308,8 @@ async def upload_generator_output(
     request_dict = json.loads(request)
     confluence_request = ConfluenceUploadRequest(**request_dict)
     
-    result = data_generator_service.upload_to_confluence(
+    result = await confluence_pool.run(
+        data_generator_service.upload_to_confluence,
         confluence_request.page_id,
         parsed_content,
         content_type,
@@ -147,21 +324,37 @@ async def upload_generator_output(
 # Meeting Summarizer Routes
 @app.post("/meeting/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
-    result = meeting_summarizer_service.transcribe_audio(file.file)
+    result = await meeting_pool.run(meeting_summarizer_service.transcribe_audio, file.file, file.filename)
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+@app.post("/meeting/transcribe/stream")
+async def stream_transcription(file: UploadFile = File(...)):
+    # The upload is spooled before responding; the stream outlives the request's file handle
+    audio_path = await document_pool.run(spool_upload, file.file, file.filename)
+    events = meeting_summarizer_service.transcribe_audio_stream(audio_path)
+    try:
+        stream = meeting_pool.stream(_sse(events))
+    except PoolFullError:
+        os.unlink(audio_path)
+        raise
+    return StreamingResponse(stream, media_type="text/event-stream")
+
 @app.post("/meeting/summarize")
 async def summarize_text(text: str = Form(...), max_length: int = Form(150), min_length: int = Form(50)):
-    result = meeting_summarizer_service.summarize_text(text, max_length, min_length)
+    result = await meeting_pool.run(meeting_summarizer_service.summarize_text, text, max_length, min_length)
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+@app.get("/meeting/stats")
+async def meeting_stats():
+    return await document_pool.run(meeting_summarizer_service.get_stats)
+
 @app.post("/meeting/generate-report")
 async def generate_meeting_report(meeting_data: MeetingData):
-    result = meeting_summarizer_service.generate_markdown_report(meeting_data.dict())
+    result = await document_pool.run(meeting_summarizer_service.generate_markdown_report, meeting_data.dict())
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
@@ -175,7 +368,8 @@ async def upload_meeting_summary(
     request_dict = json.loads(request)
     confluence_request = ConfluenceUploadRequest(**request_dict)
     
-    result = meeting_summarizer_service.upload_to_confluence(
+    result = await confluence_pool.run(
+        meeting_summarizer_service.upload_to_confluence,
         confluence_request.page_id,
         markdown_content,
         confluence_request.base_url,
@@ -186,24 +380,80 @@ async def upload_meeting_summary(
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+# Confluence Routes
+@app.post("/confluence/publish")
+async def publish_to_confluence(request: BulkPublishRequest):
+    return await confluence_pool.run(
+        confluence_publisher.publish,
+        request.base_url,
+        request.auth_token,
+        [item.dict() for item in request.items],
+        request.default_title,
+        request.max_concurrency
+    )
+
+# Job Routes
+@app.post("/jobs/transcribe")
+async def submit_transcription_job(file: UploadFile = File(...), priority: int = Form(0)):
+    audio_path = await document_pool.run(spool_upload, file.file, file.filename, upload_dir)
+    try:
+        job_id = await document_pool.run(job_queue.submit, "transcribe", {"audio_path": audio_path}, priority)
+    except PoolFullError:
+        os.unlink(audio_path)
+        raise
+    return {"job_id": job_id, "status": "queued"}
+
+@app.post("/jobs/summarize")
+async def submit_summary_job(
+    text: str = Form(...),
+    max_length: int = Form(150),
+    min_length: int = Form(50),
+    priority: int = Form(0)
+):
+    payload = {"text": text, "max_length": max_length, "min_length": min_length}
+    job_id = await document_pool.run(job_queue.submit, "summarize", payload, priority)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 100):
+    return {"jobs": await document_pool.run(job_queue.list, status, limit)}
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return await document_pool.run(job_queue.get_stats)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await document_pool.run(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    status = await document_pool.run(job_queue.cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "status": status}
+
 # NFR Assistant Routes
 @app.post("/nfr/suggest-category")
 async def suggest_nfr_category(requirement_text: str = Form(...)):
-    result = nfr_service.suggest_nfr_category(requirement_text)
+    result = await nfr_pool.run(nfr_service.suggest_nfr_category, requirement_text)
     if not result:
         raise HTTPException(status_code=400, detail="Failed to suggest category")
     return {"suggestions": result}
 
 @app.post("/nfr/generate-doc")
 async def generate_nfr_doc(nfr_data: NFRData):
-    result = nfr_service.generate_markdown_doc(nfr_data.dict())
+    result = await document_pool.run(nfr_service.generate_markdown_doc, nfr_data.dict())
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
 @app.post("/nfr/export-docx")
 async def export_nfr_to_docx(markdown_content: str = Form(...)):
-    result = nfr_service.export_to_docx(markdown_content)
+    result = await document_pool.run(nfr_service.export_to_docx, markdown_content)
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     
@@ -213,7 +463,7 @@ async def export_nfr_to_docx(markdown_content: str = Form(...)):
 
 @app.post("/nfr/export-pdf")
 async def export_nfr_to_pdf(markdown_content: str = Form(...)):
-    result = nfr_service.export_to_pdf(markdown_content)
+    result = await document_pool.run(nfr_service.export_to_pdf, markdown_content)
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
     
@@ -230,7 +480,8 @@ async def upload_nfr_doc(
     request_dict = json.loads(request)
     confluence_request = ConfluenceUploadRequest(**request_dict)
     
-    result = nfr_service.upload_to_confluence(
+    result = await confluence_pool.run(
+        nfr_service.upload_to_confluence,
         confluence_request.page_id,
         markdown_content,
         confluence_request.base_url,
@@ -241,11 +492,37 @@ async def upload_nfr_doc(
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
+# Metrics endpoints
+@app.get("/metrics/batching")
+async def batching_metrics():
+    return {
+        "batchers": [
+            shared_embedding_batcher.get_stats(),
+            search_service.qa_generator.batcher.get_stats()
+        ]
+    }
+
+@app.get("/metrics/pools")
+async def pool_metrics():
+    return {"pools": [pool.get_stats() for pool in pools]}
+
+@app.get("/metrics/confluence")
+async def confluence_metrics():
+    return {"sites": confluence_client.get_stats()}
+
 # Healthcheck endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "version": "1.0.0"}
 
+# Readiness endpoint: 503 until the MODEL_PRELOAD models are resident
+@app.get("/ready")
+async def readiness_check():
+    status = registry.get_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,271 @@
+"""
+Confluence client
+Pooled keep-alive sessions per Confluence site, with timeouts, a token-bucket rate limit and jittered retries.
+"""
+import os
+import time
+import random
+import hashlib
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from common.page_versions import PageVersionStore
+
+CONFLUENCE_CONNECT_TIMEOUT = float(os.getenv("CONFLUENCE_CONNECT_TIMEOUT", "5"))
+CONFLUENCE_TIMEOUT = float(os.getenv("CONFLUENCE_TIMEOUT", "30"))
+# Keep-alive connections per site; by default enough for a crawl and a publish batch at their
+# configured parallelism. Requests beyond it (e.g. a crawl asking for more parallelism) still go
+# out, on connections that are closed after use.
+CONFLUENCE_POOL_SIZE = int(os.getenv("CONFLUENCE_POOL_SIZE") or max(
+    16,
+    int(os.getenv("CONFLUENCE_CRAWL_PARALLELISM", "8")) + int(os.getenv("CONFLUENCE_PUBLISH_CONCURRENCY", "8"))
+))
+CONFLUENCE_MAX_RETRIES = int(os.getenv("CONFLUENCE_MAX_RETRIES", "4"))
+# Upper bound of the first retry delay; doubles with every further attempt
+CONFLUENCE_RETRY_BACKOFF_SECONDS = float(os.getenv("CONFLUENCE_RETRY_BACKOFF_SECONDS", "0.5"))
+# Longer Retry-After values than this fail the request instead of holding a worker
+CONFLUENCE_MAX_RETRY_AFTER_SECONDS = float(os.getenv("CONFLUENCE_MAX_RETRY_AFTER_SECONDS", "60"))
+# Requests per second and burst per site; 0 disables the limit
+CONFLUENCE_RATE_LIMIT = float(os.getenv("CONFLUENCE_RATE_LIMIT", "10"))
+CONFLUENCE_RATE_BURST = int(os.getenv("CONFLUENCE_RATE_BURST", "20"))
+# Page updates rejected with 409 (another writer got there first) are retried on the fresh version
+CONFLUENCE_CONFLICT_RETRIES = int(os.getenv("CONFLUENCE_CONFLICT_RETRIES", "3"))
+DEFAULT_STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "confluence")
+# Where the hash and version of the last upload to each page are kept; empty keeps them in memory
+CONFLUENCE_STATE_DIR = os.getenv("CONFLUENCE_STATE_DIR", DEFAULT_STATE_DIR)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+# A page update that reached the server creates a new version; other methods are only retried
+# when the request cannot have been processed
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+UNPROCESSED_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and up to `burst` at once"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available; returns the seconds waited"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now so concurrent callers queue up behind each other
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _Site:
+    """Connection pool, rate limit and counters shared by every client of one Confluence site"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CONFLUENCE_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.bucket = TokenBucket(CONFLUENCE_RATE_LIMIT, CONFLUENCE_RATE_BURST)
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "retries": 0, "throttled": 0, "rate_limited_seconds": 0.0, "failures": 0,
+            "pages_updated": 0, "pages_unchanged": 0, "version_conflicts": 0
+        }
+        self._page_locks = {}
+
+    def count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def page_lock(self, page_id):
+        """Serializes this process's updates of one page, so they do not conflict with each other"""
+        with self.stats_lock:
+            return self._page_locks.setdefault(str(page_id), threading.Lock())
+
+
+_sites = {}
+_sites_lock = threading.Lock()
+_page_versions = None
+
+
+def _page_version_store():
+    global _page_versions
+    with _sites_lock:
+        if _page_versions is None:
+            if CONFLUENCE_STATE_DIR:
+                os.makedirs(CONFLUENCE_STATE_DIR, exist_ok=True)
+            _page_versions = PageVersionStore(
+                os.path.join(CONFLUENCE_STATE_DIR, "page_versions.sqlite") if CONFLUENCE_STATE_DIR else ":memory:"
+            )
+        return _page_versions
+
+
+def _site(base_url):
+    with _sites_lock:
+        if base_url not in _sites:
+            _sites[base_url] = _Site(base_url)
+        return _sites[base_url]
+
+
+def get_stats():
+    """Request, retry and throttling counters per site"""
+    with _sites_lock:
+        sites = list(_sites.values())
+    stats = []
+    for site in sites:
+        with site.stats_lock:
+            stats.append({**site.stats, "base_url": site.base_url,
+                          "rate_limited_seconds": round(site.stats["rate_limited_seconds"], 3)})
+    return stats
+
+
+def _retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta or HTTP date), or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _not_sent(error):
+    """Whether a request failed before reaching the server, so it is safe to send again"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class ConfluenceClient:
+    """REST calls to one Confluence site with one user's token; cheap to create per request"""
+
+    def __init__(self, base_url, auth_token, timeout=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (CONFLUENCE_CONNECT_TIMEOUT, timeout or CONFLUENCE_TIMEOUT)
+        self.headers = {
+            "Authorization": f"Bearer {auth_token}",
+            "Content-Type": "application/json"
+        }
+        self._site = _site(self.base_url)
+
+    def request(self, method, path, **kwargs):
+        """Send a request, retrying connection errors and 429/5xx answers; raises for other errors.
+
+        Non-idempotent requests are only retried when they failed to connect or were answered
+        with 429 or 503, never after a read timeout.
+        """
+        url = f"{self.base_url}{path}"
+        site = self._site
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        for attempt in range(CONFLUENCE_MAX_RETRIES + 1):
+            waited = site.bucket.acquire()
+            if waited:
+                site.count("rate_limited_seconds", waited)
+            site.count("requests")
+            delay = None
+            try:
+                response = site.session.request(method, url, headers=self.headers, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == CONFLUENCE_MAX_RETRIES or not (idempotent or _not_sent(e)):
+                    site.count("failures")
+                    raise
+            else:
+                if response.status_code not in retry_statuses or attempt == CONFLUENCE_MAX_RETRIES:
+                    if not response.ok:
+                        site.count("failures")
+                    response.raise_for_status()
+                    return response
+                if response.status_code == 429:
+                    site.count("throttled")
+                delay = _retry_after_seconds(response)
+                if delay is not None and delay > CONFLUENCE_MAX_RETRY_AFTER_SECONDS:
+                    site.count("failures")
+                    response.raise_for_status()
+            if delay is None:
+                # Full jitter keeps clients that failed together from retrying together
+                delay = random.uniform(0, CONFLUENCE_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            site.count("retries")
+            time.sleep(delay)
+
+    def get_json(self, path, params=None):
+        return self.request("GET", path, params=params).json()
+
+    def get_page(self, page_id, expand="version"):
+        return self.get_json(f"/rest/api/content/{page_id}", {"expand": expand})
+
+    def update_page(self, page_id, title, storage_value, version):
+        """Replace a page body with storage-format content as `version`"""
+        update_data = {
+            "version": {
+                "number": version
+            },
+            "title": title,
+            "type": "page",
+            "body": {
+                "storage": {
+                    "value": storage_value,
+                    "representation": "storage"
+                }
+            }
+        }
+        return self.request("PUT", f"/rest/api/content/{page_id}", json=update_data).json()
+
+    def replace_page_body(self, page_id, storage_value, default_title):
+        """Write a new version of a page with the given body, keeping its title.
+
+        Returns {"updated", "version"}. A body identical to the last one uploaded from here is not
+        sent again. The version of the last upload is used without asking the server first; when
+        the page has changed since, the server answers 409 and the update is retried on the
+        version it reports now.
+        """
+        site = self._site
+        store = _page_version_store()
+        content_hash = hashlib.sha256(storage_value.encode("utf-8")).hexdigest()
+        with site.page_lock(page_id):
+            record = store.get(self.base_url, page_id)
+            if record is not None and record["content_hash"] == content_hash:
+                site.count("pages_unchanged")
+                return {"updated": False, "version": record["version"]}
+
+            for attempt in range(CONFLUENCE_CONFLICT_RETRIES + 1):
+                if record is None:
+                    page_data = self.get_page(page_id)
+                    record = {
+                        "version": page_data.get("version", {}).get("number", 1),
+                        "title": page_data.get("title", default_title)
+                    }
+                try:
+                    updated = self.update_page(page_id, record["title"], storage_value, record["version"] + 1)
+                except requests.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if status == 409 and attempt < CONFLUENCE_CONFLICT_RETRIES:
+                        site.count("version_conflicts")
+                        record = None
+                        continue
+                    # The page may have been moved or deleted; ask the server again next time
+                    store.delete(self.base_url, page_id)
+                    raise
+                version = updated.get("version", {}).get("number", record["version"] + 1)
+                store.put(self.base_url, page_id, content_hash, version, record["title"])
+                site.count("pages_updated")
+                return {"updated": True, "version": version}
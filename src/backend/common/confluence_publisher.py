@@ -0,0 +1,116 @@
+"""
+Confluence publisher
+Publish many markdown documents at once: render them on a process pool and upload them concurrently.
+"""
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, CancelledError, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import markdown
+from common.confluence_client import ConfluenceClient
+
+# Uploads in flight per batch; a request may ask for fewer
+CONFLUENCE_PUBLISH_CONCURRENCY = int(os.getenv("CONFLUENCE_PUBLISH_CONCURRENCY", "8"))
+# Processes rendering markdown; 0 renders on the upload threads instead
+CONFLUENCE_RENDER_WORKERS = int(os.getenv("CONFLUENCE_RENDER_WORKERS", "2"))
+
+
+def render_markdown(markdown_content):
+    """Markdown to the HTML Confluence accepts as storage format"""
+    return markdown.markdown(markdown_content)
+
+
+class ConfluencePublisher:
+    def __init__(self, render_workers=CONFLUENCE_RENDER_WORKERS, concurrency=CONFLUENCE_PUBLISH_CONCURRENCY):
+        self.render_workers = max(0, int(render_workers))
+        self.concurrency = max(1, int(concurrency))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: the API process holds threads and loaded models
+                self._executor = ProcessPoolExecutor(self.render_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def publish(self, base_url, auth_token, items, default_title, max_concurrency=None):
+        """Render and upload `items` ({page_id, markdown_content}); returns one result per item, in order.
+
+        Uploads start as soon as their document is rendered, with at most `max_concurrency` in flight,
+        so the batch takes about as long as its slowest uploads rather than the sum of them.
+        """
+        started = time.monotonic()
+        client = ConfluenceClient(base_url, auth_token)
+        concurrency = min(self.concurrency, max(1, int(max_concurrency or self.concurrency)))
+        results = [None] * len(items)
+
+        def upload(index, html_content):
+            page_id = items[index]["page_id"]
+            try:
+                result = client.replace_page_body(page_id, html_content, default_title)
+                results[index] = {"page_id": page_id, "status": "success", **result}
+            except Exception as e:
+                results[index] = {"page_id": page_id, "status": "error", "message": str(e)}
+
+        def render_and_upload(index):
+            try:
+                html_content = render_markdown(items[index]["markdown_content"])
+            except Exception as e:
+                results[index] = {"page_id": items[index]["page_id"], "status": "error", "message": str(e)}
+                return
+            upload(index, html_content)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="confluence-publish") as uploads:
+            if self.render_workers == 0 or len(items) < 2:
+                for index in range(len(items)):
+                    uploads.submit(render_and_upload, index)
+            else:
+                executor = self._pool()
+                renders = {}
+                for index, item in enumerate(items):
+                    try:
+                        renders[executor.submit(render_markdown, item["markdown_content"])] = index
+                    except (BrokenProcessPool, RuntimeError):
+                        # The pool broke or another batch shut it down; render the rest here
+                        self._reset(executor)
+                        for remaining in range(index, len(items)):
+                            uploads.submit(render_and_upload, remaining)
+                        break
+                for future in as_completed(renders):
+                    index = renders[future]
+                    try:
+                        html_content = future.result()
+                    except (BrokenProcessPool, CancelledError):
+                        # A render worker died, or another batch reset the pool; render here instead
+                        # and start a fresh pool next time
+                        self._reset(executor)
+                        uploads.submit(render_and_upload, index)
+                        continue
+                    except Exception as e:
+                        results[index] = {"page_id": items[index]["page_id"], "status": "error", "message": str(e)}
+                        continue
+                    uploads.submit(upload, index, html_content)
+
+        counts = {"updated": 0, "unchanged": 0, "failed": 0}
+        for result in results:
+            if result["status"] == "error":
+                counts["failed"] += 1
+            elif result["updated"]:
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+        return {
+            "status": "success",
+            **counts,
+            "seconds": round(time.monotonic() - started, 3),
+            "results": results
+        }
@@ -0,0 +1,180 @@
+"""
+Bounded executors
+Run blocking work on fixed-size thread pools with a capped queue, rejecting work once it is full.
+"""
+import os
+import math
+import time
+import asyncio
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Recent service times kept for the Retry-After estimate
+SERVICE_TIME_WINDOW = 100
+# Items a streaming worker may run ahead of a slow consumer
+STREAM_BUFFER_ITEMS = 64
+STREAM_CLOSED_CHECK_SECONDS = 0.5
+
+
+class PoolFullError(Exception):
+    """Raised when a pool already has max_workers running and max_queue waiting"""
+
+    def __init__(self, pool, retry_after):
+        super().__init__(f"{pool} pool is busy, retry in {retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, name, max_workers=1, max_queue=8):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"{name}-pool")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._stats_lock = threading.Lock()
+        self._service_times = []
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)`; raises PoolFullError instead of waiting for room"""
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise PoolFullError(self.name, self.retry_after())
+        with self._stats_lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(self._call, fn, args, kwargs)
+        except Exception:
+            self._release(None, failed=True)
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn` on the pool and await its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stream(self, iterable, max_buffered=STREAM_BUFFER_ITEMS):
+        """Drain a blocking iterator on one worker; returns an async iterator over its items.
+
+        The slot is taken before returning, so a full pool is reported before a response starts.
+        At most `max_buffered` items wait for the consumer; the worker blocks beyond that and
+        stops once the consumer goes away (e.g. the client disconnected).
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue(max_buffered)
+        closed = threading.Event()
+
+        def put(entry):
+            try:
+                future = asyncio.run_coroutine_threadsafe(items.put(entry), loop)
+            except RuntimeError:
+                # The event loop has shut down
+                return False
+            while True:
+                try:
+                    future.result(timeout=STREAM_CLOSED_CHECK_SECONDS)
+                    return True
+                except FutureTimeoutError:
+                    if closed.is_set():
+                        future.cancel()
+                        return False
+
+        def drain():
+            try:
+                for item in iterable:
+                    if closed.is_set() or not put((item, None, False)):
+                        return
+            except Exception as e:
+                put((None, e, True))
+                return
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+            put((None, None, True))
+
+        self.submit(drain)
+
+        async def iterate():
+            try:
+                while True:
+                    item, error, done = await items.get()
+                    if error is not None:
+                        raise error
+                    if done:
+                        return
+                    yield item
+            finally:
+                closed.set()
+
+        # An iterator dropped without ever being started also releases the worker
+        stream = iterate()
+        weakref.finalize(stream, closed.set)
+        return stream
+
+    def _call(self, fn, args, kwargs):
+        with self._stats_lock:
+            self._pending -= 1
+            self._running += 1
+        started = time.monotonic()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._release(time.monotonic() - started, failed)
+
+    def _release(self, service_time, failed):
+        with self._stats_lock:
+            if service_time is None:
+                self._pending -= 1
+            else:
+                self._running -= 1
+                self._service_times.append(service_time)
+                del self._service_times[:-SERVICE_TIME_WINDOW]
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+        self._slots.release()
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained, at least 1"""
+        with self._stats_lock:
+            if not self._service_times:
+                return 1
+            average = sum(self._service_times) / len(self._service_times)
+            backlog = self._pending + self._running
+        return max(1, math.ceil(backlog * average / self.max_workers))
+
+    def get_stats(self):
+        """Queue depth, running work and rejections"""
+        with self._stats_lock:
+            average = sum(self._service_times) / len(self._service_times) if self._service_times else 0.0
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_service_ms": round(average * 1000, 1)
+            }
+
+
+def bounded_executor(name, max_workers, max_queue):
+    """Pool sized by POOL_<NAME>_WORKERS / POOL_<NAME>_QUEUE, falling back to the given sizes"""
+    prefix = "POOL_" + name.upper().replace("-", "_")
+    return BoundedExecutor(
+        name,
+        max_workers=int(os.getenv(f"{prefix}_WORKERS", str(max_workers))),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", str(max_queue)))
+    )
@@ -0,0 +1,178 @@
+"""
+Inference cache
+Disk-backed, size-bounded LRU cache of model results keyed by a hash of their inputs.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache")
+# Empty keeps the cache in process memory
+INFERENCE_CACHE_DIR = os.getenv("INFERENCE_CACHE_DIR", DEFAULT_CACHE_DIR)
+INFERENCE_CACHE_MAX_MB = float(os.getenv("INFERENCE_CACHE_MAX_MB", "512"))
+# How often callers waiting for an identical computation check whether to stop waiting
+WAIT_POLL_SECONDS = 0.5
+
+
+def cache_key(kind, model, params, content_hash):
+    """Key for a result of `kind` produced by `model` with generation `params` from hashed content"""
+    identity = json.dumps([kind, model, params, content_hash], sort_keys=True)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def text_sha256(*texts):
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update((text or "").encode("utf-8"))
+        # Separator so ("ab", "c") and ("a", "bc") differ
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_sha256(path, chunk_bytes=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _succeeded(result):
+    return isinstance(result, dict) and result.get("status") == "success"
+
+
+class InferenceCache:
+    def __init__(self, cache_dir=INFERENCE_CACHE_DIR, max_mb=INFERENCE_CACHE_MAX_MB, name="inference"):
+        self.name = name
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, "inference_cache.sqlite") if cache_dir else ":memory:"
+        # Every process using the same directory shares entries and the size bound
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def get(self, key):
+        """Return the cached result, or None"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, value):
+        """Store a JSON-serializable result, evicting least recently used entries beyond max size"""
+        blob = zlib.compress(json.dumps(value).encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time())
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for old_key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((old_key,))
+                total -= size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+            self.evictions += len(evicted)
+
+    def get_or_compute(self, key, compute, wait=None):
+        """Return the cached result or run `compute()` once for all concurrent callers with the same key.
+
+        Only results with status "success" are stored and shared; when the running computation fails,
+        callers waiting for it compute the result themselves. `wait()` is called about every
+        WAIT_POLL_SECONDS while waiting and may raise to stop waiting.
+        """
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+
+            result = self._wait(future, wait)
+            if result is not None:
+                return result
+
+        try:
+            result = compute()
+            if _succeeded(result):
+                self.put(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    @staticmethod
+    def _wait(future, wait):
+        """The leader's result if it succeeded, else None"""
+        while True:
+            if wait is not None:
+                wait()
+            try:
+                result = future.result(timeout=WAIT_POLL_SECONDS)
+            except FutureTimeout:
+                continue
+            except BaseException:
+                return None
+            return result if _succeeded(result) else None
+
+    def get_stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": entries,
+                "size_mb": round(size / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,169 @@
+"""
+Job queue
+Run jobs from the job store on a pool of worker threads, highest priority first.
+"""
+import os
+import time
+import socket
+import threading
+from common.job_store import JobStore
+
+DEFAULT_JOBS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "jobs")
+JOBS_DIR = os.getenv("JOBS_DIR", DEFAULT_JOBS_DIR)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# First retry delay; doubles with every further attempt
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5"))
+# A running job whose worker has not checked in for this long is picked up by another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Finished jobs and their results are kept this long
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Upper bound on how long an idle worker sleeps before looking for runnable jobs again
+POLL_SECONDS = 1.0
+
+
+class JobCancelled(Exception):
+    """Raised by a handler that noticed its job was cancelled"""
+
+
+class JobContext:
+    """Handed to job handlers so they can report progress and stop early on cancellation"""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def is_cancelled(self):
+        return self.store.cancel_requested(self.job_id)
+
+    def check_cancelled(self):
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def set_progress(self, progress):
+        self.store.set_progress(self.job_id, progress)
+
+
+class JobQueue:
+    def __init__(self, jobs_dir=JOBS_DIR, workers=JOB_WORKERS):
+        # An empty jobs_dir keeps jobs in memory only; they do not survive a restart then
+        self.jobs_dir = jobs_dir
+        if jobs_dir:
+            os.makedirs(jobs_dir, exist_ok=True)
+        self.store = JobStore(os.path.join(jobs_dir, "jobs.sqlite") if jobs_dir else ":memory:")
+        self.workers = max(1, int(workers))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}
+        self._wakeup = threading.Condition()
+        self._threads = []
+
+    def register(self, kind, handler, cleanup=None):
+        """`handler(payload, context)` returns a service result dict; `cleanup(payload)` runs once the job is finished"""
+        self._handlers[kind] = (handler, cleanup)
+
+    def submit(self, kind, payload, priority=0):
+        """Queue a job; returns its id"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.create(kind, payload, priority, JOB_MAX_ATTEMPTS)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def list(self, status=None, limit=100):
+        return self.store.list(status, limit)
+
+    def cancel(self, job_id):
+        """Cancel a job; a running job stops at its handler's next cancellation check"""
+        status = self.store.request_cancel(job_id)
+        if status == "cancelled":
+            self._cleanup(job_id)
+        return status
+
+    def start(self):
+        """Start the workers; jobs left queued or running by a previous process are picked up"""
+        if self._threads:
+            return
+        self._housekeeping()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+
+    def get_stats(self):
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "jobs": self.store.counts()
+        }
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_LEASE_SECONDS / 3)
+            self.store.heartbeat(self.owner)
+            try:
+                self._housekeeping()
+            except Exception:
+                # Retried on the next beat; the heartbeat itself must keep going
+                pass
+
+    def _housekeeping(self):
+        """Fail abandoned jobs and delete expired ones, cleaning up after both"""
+        for jobs in (
+            self.store.fail_abandoned(JOB_LEASE_SECONDS),
+            self.store.delete_finished(JOB_RETENTION_SECONDS)
+        ):
+            for _, kind, payload in jobs:
+                self._run_cleanup(kind, payload)
+
+    def _work(self):
+        while True:
+            claimed = self.store.claim(self.owner, JOB_LEASE_SECONDS)
+            if claimed is None:
+                next_run = self.store.next_run_after()
+                timeout = POLL_SECONDS if next_run is None else min(max(next_run - time.time(), 0.01), POLL_SECONDS)
+                with self._wakeup:
+                    self._wakeup.wait(timeout)
+                continue
+            self._run(*claimed)
+
+    def _run(self, job_id, kind, payload):
+        handler, _ = self._handlers.get(kind, (None, None))
+        context = JobContext(self.store, job_id)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {kind}")
+            result = handler(payload, context)
+            error = result.get("message") if result.get("status") == "error" else None
+        except JobCancelled:
+            result, error = None, None
+        except Exception as e:
+            result, error = None, str(e)
+
+        if context.is_cancelled():
+            self.store.finish(job_id, self.owner, "cancelled")
+        elif error is None:
+            self.store.finish(job_id, self.owner, "succeeded", result=result)
+        else:
+            attempts = self.store.get(job_id)["attempts"]
+            delay = JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+            if self.store.retry(job_id, self.owner, error, delay):
+                return
+            self.store.finish(job_id, self.owner, "failed", error=error)
+        self._cleanup(job_id)
+
+    def _cleanup(self, job_id):
+        job = self.store.get(job_id)
+        if job is not None:
+            self._run_cleanup(job["kind"], self.store.get_payload(job_id))
+
+    def _run_cleanup(self, kind, payload):
+        _, cleanup = self._handlers.get(kind, (None, None))
+        if cleanup is not None:
+            cleanup(payload)
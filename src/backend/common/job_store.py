@@ -0,0 +1,243 @@
+"""
+Job store
+SQLite-backed job records shared by every worker process that serves the same data directory.
+"""
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+_COLUMNS = (
+    "job_id, kind, status, priority, payload, result, error, progress, attempts, max_attempts, "
+    "cancel_requested, created_at, started_at, finished_at"
+)
+
+
+class JobStore:
+    def __init__(self, path=":memory:"):
+        self.path = path
+        # Autocommit; claims open their own IMMEDIATE transaction to lock out other processes
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    progress TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    run_after REAL NOT NULL,
+                    heartbeat_at REAL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at)")
+
+    def create(self, kind, payload, priority=0, max_attempts=3):
+        """Insert a queued job; returns its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, priority, payload, max_attempts, run_after, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, int(priority), json.dumps(payload), int(max_attempts), now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        """Return the job as a dict, or None"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def get_payload(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, status=None, limit=100):
+        """Most recent jobs first, optionally filtered by status"""
+        query = f"SELECT {_COLUMNS} FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def counts(self):
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def claim(self, owner, lease_seconds):
+        """Mark the next runnable job as running for `owner` and return (job_id, kind, payload).
+
+        Running jobs whose owner stopped heart-beating (e.g. after a restart) are runnable again
+        while they have attempts left; `fail_abandoned` fails the others. Returns None when nothing
+        is runnable.
+        """
+        now = time.time()
+        expired = now - lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id, kind, payload FROM jobs "
+                    "WHERE (status = 'queued' AND run_after <= ?) "
+                    "OR (status = 'running' AND heartbeat_at < ? AND attempts < max_attempts) "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now, expired)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, "
+                        "started_at = ?, heartbeat_at = ?, error = NULL WHERE job_id = ?",
+                        (owner, now, now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def fail_abandoned(self, lease_seconds):
+        """Fail running jobs whose owner stopped heart-beating and that are out of attempts.
+
+        Returns their (job_id, kind, payload), to exactly one caller across processes.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT job_id, kind, payload FROM jobs "
+                    "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= max_attempts",
+                    (now - lease_seconds,)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', "
+                    "finished_at = ?, owner = NULL WHERE job_id = ?",
+                    [(now, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(job_id, kind, json.loads(payload)) for job_id, kind, payload in rows]
+
+    def next_run_after(self):
+        """Earliest time a queued job becomes runnable, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(run_after) FROM jobs WHERE status = 'queued'").fetchone()
+        return row[0]
+
+    def heartbeat(self, owner):
+        """Extend the lease of every job `owner` is running"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?", (time.time(), owner)
+            )
+
+    def set_progress(self, job_id, progress):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE job_id = ?",
+                (json.dumps(progress), time.time(), job_id)
+            )
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def request_cancel(self, job_id):
+        """Cancel a queued job now, or flag a running one; returns the new status or None if unknown"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (now, job_id)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,)
+            )
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def finish(self, job_id, owner, status, result=None, error=None):
+        """Record the outcome of a run; ignored if the job was claimed by someone else meanwhile"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, owner = NULL "
+                "WHERE job_id = ? AND owner = ? AND status = 'running'",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, owner)
+            )
+
+    def retry(self, job_id, owner, error, delay_seconds):
+        """Queue a failed run again after `delay_seconds`; returns False once attempts are used up"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, owner = NULL "
+                "WHERE job_id = ? AND owner = ? AND status = 'running' AND attempts < max_attempts "
+                "AND cancel_requested = 0",
+                (error, time.time() + delay_seconds, job_id, owner)
+            )
+        return cursor.rowcount > 0
+
+    def delete_finished(self, older_than_seconds):
+        """Delete finished jobs older than the retention period; returns their (job_id, kind, payload)"""
+        cutoff = time.time() - older_than_seconds
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id, kind, payload FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                (*FINISHED_STATUSES, cutoff)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(row[0],) for row in rows])
+        return [(job_id, kind, json.loads(payload)) for job_id, kind, payload in rows]
+
+    @staticmethod
+    def _to_job(row):
+        (job_id, kind, status, priority, payload, result, error, progress, attempts, max_attempts,
+         cancel_requested, created_at, started_at, finished_at) = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "priority": priority,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "progress": json.loads(progress) if progress else None,
+            "attempts": attempts,
+            "max_attempts": max_attempts,
+            "cancel_requested": bool(cancel_requested),
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at
+        }
@@ -0,0 +1,149 @@
+"""
+Micro-batching
+Collect concurrent single-item requests for a few milliseconds and run them as one batch.
+"""
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+# Number of recent queueing delays kept for percentiles
+DELAY_WINDOW = 1000
+
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5.0, name="batcher", batch_key=None):
+        """`process_batch(items)` must return one result per item, in order.
+
+        Items with different `batch_key(item)` values are never put in the same batch.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.name = name
+        self.batch_key = batch_key
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._delays = deque(maxlen=DELAY_WINDOW)
+        self._requests = 0
+        self._batches = 0
+        self._busy_seconds = 0.0
+        self._started_at = time.monotonic()
+
+    def submit(self, item):
+        """Queue one item; returns a Future resolved with its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def run(self, item):
+        """Queue one item and wait for its result"""
+        return self.submit(item).result()
+
+    def run_many(self, items):
+        """Queue several items and wait for all their results"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, name=f"{self.name}-worker", daemon=True)
+                self._worker.start()
+
+    def _loop(self):
+        pending = []
+        while True:
+            # Leftovers from another key go first; otherwise block for the next request
+            if not pending:
+                pending.append(self._queue.get())
+            deadline = pending[0][2] + self.max_wait
+
+            while len(pending) < self.max_batch_size:
+                # Requests that queued up during the previous batch are taken without waiting
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        pending.append(self._queue.get(timeout=timeout))
+                    else:
+                        pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch, pending = self._split_batch(pending)
+            self._run_batch(batch)
+
+    def _split_batch(self, pending):
+        """Take the oldest request's key group (up to max_batch_size) and leave the rest pending"""
+        if self.batch_key is None:
+            return pending[:self.max_batch_size], pending[self.max_batch_size:]
+        key = self.batch_key(pending[0][0])
+        batch, rest = [], []
+        for entry in pending:
+            if len(batch) < self.max_batch_size and self.batch_key(entry[0]) == key:
+                batch.append(entry)
+            else:
+                rest.append(entry)
+        return batch, rest
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        items = [item for item, _, _ in batch]
+        try:
+            results = self.process_batch(items)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            results = None
+
+        if results is not None:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._busy_seconds += time.monotonic() - started
+            self._delays.extend(started - enqueued for _, _, enqueued in batch)
+
+    def get_stats(self):
+        """Throughput and per-request queueing delay"""
+        with self._stats_lock:
+            delays_ms = np.array(self._delays) * 1000
+            elapsed = time.monotonic() - self._started_at
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+                "requests_per_sec": round(self._requests / elapsed, 2) if elapsed > 0 else 0.0,
+                "busy_requests_per_sec": round(self._requests / self._busy_seconds, 2) if self._busy_seconds else 0.0,
+                "queue_delay_ms_p50": round(float(np.percentile(delays_ms, 50)), 3) if len(delays_ms) else 0.0,
+                "queue_delay_ms_p95": round(float(np.percentile(delays_ms, 95)), 3) if len(delays_ms) else 0.0,
+                "queue_delay_ms_max": round(float(delays_ms.max()), 3) if len(delays_ms) else 0.0
+            }
+
+
+def embedding_batcher(encode, name):
+    """Batcher for single-text `encode(texts)` calls; each result is a float32 vector"""
+    return MicroBatcher(
+        lambda texts: list(np.asarray(encode(texts), dtype='float32')),
+        max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+        name=name
+    )
@@ -0,0 +1,203 @@
+"""
+Model backend benchmark
+Compare torch, torch-int8 and onnx backends on latency, throughput, memory and agreement with fp32.
+
+Each backend runs in its own subprocess so load time and peak memory are measured from a clean start.
+
+Usage (from the backend folder):
+    python -m common.model_benchmark
+    python -m common.model_benchmark --models embedding qa --backends torch torch-int8
+    python -m common.model_benchmark --models transcription --audio samples/standup.mp3
+"""
+import os
+import sys
+import json
+import time
+import difflib
+import argparse
+import resource
+import subprocess
+import numpy as np
+
+BENCHMARK_MODELS = ("embedding", "qa", "summarizer", "transcription")
+# Environment variable that selects each model's backend in common.model_registry
+BACKEND_SETTINGS = {
+    "embedding": "EMBEDDING_BACKEND",
+    "qa": "QA_BACKEND",
+    "summarizer": "SUMMARIZER_BACKEND",
+    "transcription": "TRANSCRIPTION_BACKEND"
+}
+
+SAMPLE_TEXTS = [
+    "The login page must respond within 200 milliseconds for 95 percent of requests.",
+    "All personal data has to be encrypted at rest and in transit.",
+    "The deployment pipeline runs integration tests against a staging database before release.",
+    "Users can reset their password through a link that expires after 30 minutes.",
+    "The service must stay available during a single availability zone outage.",
+    "Error ERR_CONN_RESET appears when the upstream proxy closes idle connections.",
+    "Release 2.3.1 moves report generation to a background worker queue.",
+    "The team agreed to review the on-call rotation at the next retrospective."
+]
+SAMPLE_QUESTIONS = [
+    ("How fast must the login page respond?", SAMPLE_TEXTS[0]),
+    ("How long is a password reset link valid?", SAMPLE_TEXTS[3]),
+    ("What happens before a release?", SAMPLE_TEXTS[2]),
+    ("Why does ERR_CONN_RESET appear?", SAMPLE_TEXTS[5])
+]
+SAMPLE_MEETING = " ".join(SAMPLE_TEXTS * 4)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(fn, inputs):
+    """Run fn on each input; returns (outputs, per-call latencies in seconds)"""
+    outputs, latencies = [], []
+    for item in inputs:
+        started = time.perf_counter()
+        outputs.append(fn(item))
+        latencies.append(time.perf_counter() - started)
+    return outputs, latencies
+
+
+def _run_embedding(registry, repeats):
+    model = registry.get("embedding")
+    outputs, latencies = _timed(lambda text: model.encode([text])[0], SAMPLE_TEXTS * repeats)
+    batch = SAMPLE_TEXTS * repeats * 4
+    started = time.perf_counter()
+    model.encode(batch, batch_size=32)
+    throughput = len(batch) / (time.perf_counter() - started)
+    return [output.tolist() for output in outputs[:len(SAMPLE_TEXTS)]], latencies, throughput
+
+
+def _run_generation(registry, name, inputs, max_length, min_length, repeats):
+    tokenizer = registry.get(f"{name}-tokenizer")
+    model = registry.get(f"{name}-model")
+
+    def generate(text):
+        encoded = tokenizer(text, return_tensors="pt", max_length=512 if name == "qa" else 1024, truncation=True)
+        output = model.generate(
+            encoded.input_ids,
+            attention_mask=encoded.attention_mask,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False,
+            num_beams=4
+        )
+        return tokenizer.decode(output[0], skip_special_tokens=True)
+
+    outputs, latencies = _timed(generate, inputs * repeats)
+    return outputs[:len(inputs)], latencies, len(latencies) / sum(latencies)
+
+
+def _run_transcription(registry, audio_paths, repeats):
+    transcriber = registry.get("transcriber")
+    outputs, latencies = _timed(lambda path: transcriber(path).get("text", ""), audio_paths * repeats)
+    return outputs[:len(audio_paths)], latencies, len(latencies) / sum(latencies)
+
+
+def run_worker(model_name, audio_paths, repeats):
+    """Load one model with the backend selected in the environment and measure it"""
+    from common.model_registry import registry
+    baseline_mb = _peak_rss_mb()
+    started = time.perf_counter()
+    if model_name == "embedding":
+        registry.get("embedding")
+    elif model_name == "transcription":
+        registry.get("transcriber")
+    else:
+        registry.get(f"{model_name}-tokenizer")
+        registry.get(f"{model_name}-model")
+    load_seconds = time.perf_counter() - started
+
+    if model_name == "embedding":
+        outputs, latencies, throughput = _run_embedding(registry, repeats)
+    elif model_name == "qa":
+        inputs = [f"question: {question} context: {context}" for question, context in SAMPLE_QUESTIONS]
+        outputs, latencies, throughput = _run_generation(registry, "qa", inputs, 100, 1, repeats)
+    elif model_name == "summarizer":
+        outputs, latencies, throughput = _run_generation(registry, "summarizer", [SAMPLE_MEETING], 150, 50, repeats)
+    else:
+        outputs, latencies, throughput = _run_transcription(registry, audio_paths, repeats)
+
+    latencies_ms = np.array(latencies) * 1000
+    size_mb = sum(
+        model["size_mb"] for model in registry.get_status()["models"].values() if model["resident"]
+    )
+    return {
+        "load_seconds": round(load_seconds, 2),
+        "model_size_mb": round(size_mb, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_growth_mb": round(_peak_rss_mb() - baseline_mb, 1),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+        "throughput_per_sec": round(throughput, 2),
+        "outputs": outputs
+    }
+
+
+def _agreement(model_name, outputs, baseline):
+    """Mean cosine similarity for embeddings; exact-match rate and text similarity otherwise"""
+    if model_name == "embedding":
+        a, b = np.array(outputs), np.array(baseline)
+        cosine = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+        return {"mean_cosine": round(float(cosine.mean()), 4), "min_cosine": round(float(cosine.min()), 4)}
+    return {
+        "exact_match": round(sum(x == y for x, y in zip(outputs, baseline)) / len(baseline), 3),
+        "text_similarity": round(float(np.mean([
+            difflib.SequenceMatcher(None, x, y).ratio() for x, y in zip(outputs, baseline)
+        ])), 3)
+    }
+
+
+def benchmark_backends(models, backends, audio_paths=(), repeats=3):
+    """Run every (model, backend) pair in a subprocess and compare each backend to torch fp32"""
+    reports = []
+    for model_name in models:
+        results = {}
+        for backend in dict.fromkeys(("torch",) + tuple(backends)):
+            env = dict(os.environ, **{BACKEND_SETTINGS[model_name]: backend})
+            completed = subprocess.run(
+                [sys.executable, "-m", "common.model_benchmark", "--worker", model_name,
+                 "--repeats", str(repeats), "--audio", *audio_paths],
+                env=env, capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                results[backend] = {"error": completed.stderr.strip().splitlines()[-1:]}
+                continue
+            results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+        baseline = results["torch"].get("outputs")
+        for backend, result in results.items():
+            outputs = result.pop("outputs", None)
+            report = {"model": model_name, "backend": backend, **result}
+            if outputs is not None and baseline is not None:
+                report["agreement"] = _agreement(model_name, outputs, baseline)
+            reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", choices=BENCHMARK_MODELS, default=["embedding", "qa", "summarizer"])
+    parser.add_argument("--backends", nargs="+", choices=("torch", "torch-int8", "onnx"),
+                        default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--audio", nargs="*", default=[], help="Audio files for the transcription benchmark")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--worker", choices=BENCHMARK_MODELS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.audio, args.repeats)))
+        return
+    if "transcription" in args.models and not args.audio:
+        parser.error("--audio is required to benchmark transcription")
+
+    for report in benchmark_backends(args.models, args.backends, args.audio, args.repeats):
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
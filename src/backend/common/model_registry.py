@@ -0,0 +1,283 @@
+"""
+Model registry
+Load each model once on first use, share it across services and unload it when idle or over budget.
+"""
+import os
+import gc
+import time
+import threading
+from common.micro_batcher import embedding_batcher
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+QA_MODEL = os.getenv("QA_MODEL", "google/flan-t5-base")
+SUMMARIZER_MODEL = os.getenv("SUMMARIZER_MODEL", "facebook/bart-large-cnn")
+TRANSCRIPTION_MODEL = os.getenv("TRANSCRIPTION_MODEL", "openai/whisper-base")
+# Inference backend per model: torch (fp32), torch-int8 (dynamic quantization of Linear layers)
+# or onnx (ONNX Runtime, needs optimum[onnxruntime])
+MODEL_BACKENDS = ("torch", "torch-int8", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+QA_BACKEND = os.getenv("QA_BACKEND", "torch")
+SUMMARIZER_BACKEND = os.getenv("SUMMARIZER_BACKEND", "torch")
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "torch")
+# Exported ONNX models are cached here so the export only runs once
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "onnx")
+MODEL_ONNX_DIR = os.getenv("MODEL_ONNX_DIR", DEFAULT_ONNX_DIR)
+# 0 keeps models resident until the memory budget needs the room
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "0"))
+# 0 disables the budget
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Comma-separated models loaded at startup; the API is not ready until they are resident
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", "").split(",") if name.strip()]
+
+
+def _tensor_bytes(value):
+    # Dynamically quantized layers keep their int8 weights as (weight, bias) tuples in the state dict
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    if hasattr(value, "element_size"):
+        return value.numel() * value.element_size()
+    return 0
+
+
+def _model_bytes(model):
+    """Weight bytes of a torch module, a pipeline, a SentenceTransformer or an exported ONNX model"""
+    for candidate in (model, getattr(model, "model", None)):
+        if hasattr(candidate, "state_dict"):
+            return sum(_tensor_bytes(value) for value in candidate.state_dict().values())
+        save_dir = getattr(candidate, "model_save_dir", None)
+        if save_dir and os.path.isdir(save_dir):
+            return sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(save_dir) for name in names
+            )
+    return 0
+
+
+class _Entry:
+    def __init__(self, loader):
+        self.loader = loader
+        self.model = None
+        self.size_bytes = 0
+        self.last_used = 0.0
+        self.load_seconds = 0.0
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self, idle_seconds=MODEL_IDLE_SECONDS, memory_budget_mb=MODEL_MEMORY_BUDGET_MB):
+        self.idle_seconds = idle_seconds
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._preloading = set()
+        self.preload_errors = {}
+
+    def register(self, name, loader):
+        """Register a zero-argument loader; nothing is loaded until `get(name)`"""
+        with self._lock:
+            self._entries[name] = _Entry(loader)
+
+    def get(self, name):
+        """Return the model, loading it on first use or after an eviction"""
+        entry = self._entries[name]
+        entry.last_used = time.monotonic()
+        model = entry.model
+        if model is not None:
+            return model
+
+        with entry.lock:
+            if entry.model is None:
+                started = time.monotonic()
+                loaded = entry.loader()
+                entry.size_bytes = _model_bytes(loaded)
+                entry.load_seconds = time.monotonic() - started
+                entry.loads += 1
+                entry.model = loaded
+            model = entry.model
+        entry.last_used = time.monotonic()
+        self._enforce_budget(keep=name)
+        self._ensure_reaper()
+        return model
+
+    def unload(self, name):
+        """Drop the registry's reference; callers still using the model keep it alive until they finish"""
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.model is None:
+                return False
+            entry.model = None
+            entry.size_bytes = 0
+            entry.evictions += 1
+        gc.collect()
+        return True
+
+    def evict_idle(self):
+        """Unload models unused for longer than idle_seconds"""
+        if not self.idle_seconds:
+            return []
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [name for name, entry in self._entries.items() if entry.model is not None and entry.last_used < cutoff]
+        return [name for name in idle if self.unload(name)]
+
+    def _enforce_budget(self, keep):
+        """Unload least recently used models until the resident total fits the budget"""
+        if not self.memory_budget_bytes:
+            return
+        resident = sorted(
+            (entry.last_used, name) for name, entry in self._entries.items()
+            if entry.model is not None and name != keep
+        )
+        total = sum(entry.size_bytes for entry in self._entries.values() if entry.model is not None)
+        for _, name in resident:
+            if total <= self.memory_budget_bytes:
+                break
+            size = self._entries[name].size_bytes
+            if self.unload(name):
+                total -= size
+
+    def _ensure_reaper(self):
+        if not self.idle_seconds or self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="model-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        interval = min(max(self.idle_seconds / 4, 1.0), 60.0)
+        while True:
+            time.sleep(interval)
+            self.evict_idle()
+
+    def preload(self, names):
+        """Load models in the background; `is_ready()` is False until all of them loaded"""
+        self._preloading.update(names)
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    self.preload_errors[name] = str(e)
+                finally:
+                    self._preloading.discard(name)
+
+        threading.Thread(target=run, name="model-preload", daemon=True).start()
+
+    def is_ready(self):
+        return not self._preloading and not self.preload_errors
+
+    def get_status(self):
+        """Which models are resident, their size and how long they have been idle"""
+        now = time.monotonic()
+        models = {}
+        for name, entry in self._entries.items():
+            resident = entry.model is not None
+            models[name] = {
+                "resident": resident,
+                "size_mb": round(entry.size_bytes / (1024 * 1024), 1),
+                "idle_seconds": round(now - entry.last_used, 1) if resident else None,
+                "load_seconds": round(entry.load_seconds, 2),
+                "loads": entry.loads,
+                "evictions": entry.evictions
+            }
+        return {
+            "ready": self.is_ready(),
+            "resident_mb": round(sum(m["size_mb"] for m in models.values()), 1),
+            "memory_budget_mb": round(self.memory_budget_bytes / (1024 * 1024), 1),
+            "idle_seconds": self.idle_seconds,
+            "preload_errors": self.preload_errors,
+            "models": models,
+            "backends": {
+                "embedding": EMBEDDING_BACKEND,
+                "qa": QA_BACKEND,
+                "summarizer": SUMMARIZER_BACKEND,
+                "transcription": TRANSCRIPTION_BACKEND
+            }
+        }
+
+
+def _check_backend(backend):
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}, expected one of {', '.join(MODEL_BACKENDS)}")
+    return backend
+
+
+def _quantize(module):
+    """fp32 Linear layers replaced by dynamically quantized int8 ones"""
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(ort_class, model_name):
+    """Load an ONNX Runtime model, exporting it from the PyTorch checkpoint on first use"""
+    path = os.path.join(MODEL_ONNX_DIR, model_name.replace("/", "--"))
+    if os.path.isdir(path):
+        return ort_class.from_pretrained(path)
+    model = ort_class.from_pretrained(model_name, export=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    model.save_pretrained(temp_path)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        # Another process published the export first
+        pass
+    return model
+
+
+def _load_embedding_model(backend=EMBEDDING_BACKEND):
+    from sentence_transformers import SentenceTransformer
+    if _check_backend(backend) == "onnx":
+        return SentenceTransformer(EMBEDDING_MODEL, backend="onnx")
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    return _quantize(model) if backend == "torch-int8" else model
+
+
+def _load_tokenizer(model_name):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def _load_seq2seq_model(model_name, backend):
+    if _check_backend(backend) == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        return _load_onnx(ORTModelForSeq2SeqLM, model_name)
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    return _quantize(model) if backend == "torch-int8" else model
+
+
+def _load_transcriber(backend=TRANSCRIPTION_BACKEND):
+    from transformers import pipeline
+    if _check_backend(backend) == "onnx":
+        from transformers import AutoProcessor
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        processor = AutoProcessor.from_pretrained(TRANSCRIPTION_MODEL)
+        return pipeline(
+            "automatic-speech-recognition",
+            model=_load_onnx(ORTModelForSpeechSeq2Seq, TRANSCRIPTION_MODEL),
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor
+        )
+    transcriber = pipeline("automatic-speech-recognition", model=TRANSCRIPTION_MODEL)
+    if backend == "torch-int8":
+        transcriber.model = _quantize(transcriber.model)
+    return transcriber
+
+
+for _backend in (EMBEDDING_BACKEND, QA_BACKEND, SUMMARIZER_BACKEND, TRANSCRIPTION_BACKEND):
+    _check_backend(_backend)
+
+registry = ModelRegistry()
+registry.register("embedding", _load_embedding_model)
+registry.register("qa-tokenizer", lambda: _load_tokenizer(QA_MODEL))
+registry.register("qa-model", lambda: _load_seq2seq_model(QA_MODEL, QA_BACKEND))
+registry.register("summarizer-tokenizer", lambda: _load_tokenizer(SUMMARIZER_MODEL))
+registry.register("summarizer-model", lambda: _load_seq2seq_model(SUMMARIZER_MODEL, SUMMARIZER_BACKEND))
+registry.register("transcriber", _load_transcriber)
+
+# One batcher for every service, so search and NFR queries share model calls
+shared_embedding_batcher = embedding_batcher(lambda texts: registry.get("embedding").encode(texts), "embeddings")
@@ -0,0 +1,51 @@
+"""
+Page versions
+SQLite record of the content hash and version last uploaded to each Confluence page, shared by every worker process.
+"""
+import time
+import sqlite3
+import threading
+
+
+class PageVersionStore:
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    base_url TEXT NOT NULL,
+                    page_id TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    uploaded_at REAL NOT NULL,
+                    PRIMARY KEY (base_url, page_id)
+                )
+            """)
+
+    def get(self, base_url, page_id):
+        """Last upload to a page as {content_hash, version, title}, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, version, title FROM pages WHERE base_url = ? AND page_id = ?",
+                (base_url, str(page_id))
+            ).fetchone()
+        if row is None:
+            return None
+        return {"content_hash": row[0], "version": row[1], "title": row[2]}
+
+    def put(self, base_url, page_id, content_hash, version, title):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (base_url, page_id, content_hash, version, title, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (base_url, str(page_id), content_hash, int(version), title, time.time())
+            )
+
+    def delete(self, base_url, page_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE base_url = ? AND page_id = ?", (base_url, str(page_id)))
@@ -0,0 +1,113 @@
+"""
+Bulk generation
+Render large record counts on a process pool in fixed-size, individually seeded shards.
+"""
+import os
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from jinja2 import Environment
+from faker import Faker
+from common.lru_cache import LRUCache
+from data_generator.faker_fields import referenced_fields, lazy_faker_safe
+from data_generator.records import STREAM_FRAMING, serialize_record, closing
+
+GENERATOR_BULK_WORKERS = int(os.getenv("GENERATOR_BULK_WORKERS", str(os.cpu_count() or 1)))
+# Records per shard; fixed so the output never depends on the number of workers
+GENERATOR_BULK_SHARD_SIZE = int(os.getenv("GENERATOR_BULK_SHARD_SIZE", "1000"))
+# Compiled templates kept per process, in the API process as well as in the workers
+GENERATOR_BULK_TEMPLATE_CACHE_SIZE = int(os.getenv("GENERATOR_BULK_TEMPLATE_CACHE_SIZE", "32"))
+
+# Compiled templates of this process by content hash; rendering from them is thread-safe
+_compiled = LRUCache(GENERATOR_BULK_TEMPLATE_CACHE_SIZE, name="bulk-templates")
+
+
+def shard_seed(seed, shard):
+    """Seed of one shard, derived from the master seed"""
+    digest = hashlib.sha256(f"{seed}:{shard}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def render_shard(content, template_type, output_format, seed, first, count):
+    """Serialized records `first` .. `first + count - 1`, each preceded by its separator"""
+    key = hashlib.sha256(f"{template_type}\0{content}".encode("utf-8")).hexdigest()
+    template_data = _compiled.get(key)
+    if template_data is None:
+        environment = Environment()
+        template_ast = environment.parse(content)
+        template_data = {
+            "type": template_type,
+            "compiled": environment.from_string(template_ast),
+            "lazy_faker": lazy_faker_safe(*referenced_fields(template_ast))
+        }
+        _compiled.put(key, template_data)
+    # A Faker of its own: small shards also run in-process, on several request threads at once
+    faker = Faker()
+    faker.seed_instance(seed)
+
+    separator = STREAM_FRAMING[output_format][1]
+    parts = []
+    for i in range(first, first + count):
+        if i:
+            parts.append(separator)
+        parts.append(serialize_record(template_data, faker, output_format))
+    return "".join(parts)
+
+
+class BulkGenerator:
+    def __init__(self, workers=GENERATOR_BULK_WORKERS, shard_size=GENERATOR_BULK_SHARD_SIZE):
+        self.workers = max(1, int(workers))
+        self.shard_size = max(1, int(shard_size))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: the API process holds threads and loaded models
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_chunks(self, content, template_type, output_format, seed, count):
+        """Text chunks of the whole output: opening, one chunk per shard in order, closing.
+
+        At most two shards per worker are in flight, so memory stays bounded however large `count` is.
+        """
+        yield STREAM_FRAMING[output_format][0]
+        shards = [
+            (content, template_type, output_format, shard_seed(seed, i), first, min(self.shard_size, count - first))
+            for i, first in enumerate(range(0, count, self.shard_size))
+        ]
+        if len(shards) <= 1:
+            # Not worth starting worker processes for
+            for shard in shards:
+                yield render_shard(*shard)
+            yield closing(output_format, count)
+            return
+
+        executor = self._pool()
+        pending = deque()
+        try:
+            for shard in shards:
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(render_shard, *shard))
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            self._reset(executor)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+        yield closing(output_format, count)
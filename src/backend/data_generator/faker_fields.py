@@ -0,0 +1,93 @@
+"""
+Faker fields
+The `faker.*` values available to templates, computed only when a template reads them.
+"""
+from jinja2 import nodes
+
+# Field name -> value for one record
+FAKER_FIELDS = {
+    "name": lambda faker: faker.name(),
+    "address": lambda faker: faker.address(),
+    "email": lambda faker: faker.email(),
+    "company": lambda faker: faker.company(),
+    "job": lambda faker: faker.job(),
+    "phone": lambda faker: faker.phone_number(),
+    "ssn": lambda faker: faker.ssn(),
+    "date": lambda faker: faker.date(),
+    "time": lambda faker: faker.time(),
+    "datetime": lambda faker: faker.date_time().isoformat(),
+    "uuid": lambda faker: str(faker.uuid4()),
+    "number": lambda faker: faker.random_int(min=1, max=100),
+    "decimal": lambda faker: faker.random_number(digits=2) / 100,
+    "paragraph": lambda faker: faker.paragraph(),
+    "sentence": lambda faker: faker.sentence(),
+    "word": lambda faker: faker.word(),
+    "url": lambda faker: faker.url(),
+    "image_url": lambda faker: faker.image_url(),
+    "ipv4": lambda faker: faker.ipv4(),
+    "ipv6": lambda faker: faker.ipv6(),
+    "user_agent": lambda faker: faker.user_agent(),
+    "color": lambda faker: faker.color_name(),
+    "hex_color": lambda faker: faker.hex_color(),
+    "rgb_color": lambda faker: faker.rgb_color(),
+    "credit_card_number": lambda faker: faker.credit_card_number(),
+    "credit_card_provider": lambda faker: faker.credit_card_provider(),
+    "currency_code": lambda faker: faker.currency_code(),
+    "currency_name": lambda faker: faker.currency_name(),
+    "cryptocurrency_name": lambda faker: faker.cryptocurrency_name(),
+    "cryptocurrency_code": lambda faker: faker.cryptocurrency_code(),
+    "iban": lambda faker: faker.iban(),
+}
+
+
+def faker_values(faker):
+    """Every field's value for one record"""
+    return {name: field(faker) for name, field in FAKER_FIELDS.items()}
+
+
+class LazyFakerFields(dict):
+    """One record's faker values; each field is generated on first access and then reused"""
+
+    def __init__(self, faker):
+        super().__init__()
+        self.faker = faker
+
+    def __missing__(self, key):
+        field = FAKER_FIELDS.get(key)
+        if field is None:
+            # Unknown fields render as undefined, as they did with a plain dict
+            raise KeyError(key)
+        value = self[key] = field(self.faker)
+        return value
+
+
+def referenced_fields(template_ast):
+    """Return (fields, dynamic) for a parsed template.
+
+    `fields` are the names read as `faker.x` or `faker["x"]`; `dynamic` is True when the
+    template uses `faker` in a way that cannot be resolved statically (e.g. `faker[key]`).
+    """
+    fields = set()
+    resolved = set()
+    for node in template_ast.find_all((nodes.Getattr, nodes.Getitem)):
+        target = node.node
+        if not (isinstance(target, nodes.Name) and target.name == "faker"):
+            continue
+        if isinstance(node, nodes.Getattr):
+            fields.add(node.attr)
+        elif isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+            fields.add(node.arg.value)
+        else:
+            continue
+        resolved.add(id(target))
+    uses = [node for node in template_ast.find_all(nodes.Name) if node.name == "faker"]
+    dynamic = any(id(node) not in resolved for node in uses)
+    return sorted(fields), dynamic
+
+
+def lazy_faker_safe(fields, dynamic):
+    """Whether a template reads only known fields by name, so LazyFakerFields renders it like the full dict.
+
+    Templates using `faker` as a whole (`faker | tojson`, `faker.items()`) need every value up front.
+    """
+    return not dynamic and all(field in FAKER_FIELDS for field in fields)
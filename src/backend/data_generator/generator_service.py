@@ -5,140 +5,283 @@ Generate fake JSON/XML records using templates.
 """
 import os
 import json
-import xml.etree.ElementTree as ET
-import xml.dom.minidom
-from jinja2 import Template
+import time
+import secrets
+from jinja2 import Environment, TemplateSyntaxError
 from faker import Faker
-import requests
+from data_generator.faker_fields import FAKER_FIELDS, referenced_fields, lazy_faker_safe
+from data_generator.records import STREAM_FORMATS, STREAM_FRAMING, render_record, serialize_record, closing
+from data_generator.bulk import BulkGenerator
+from data_generator.pooled import ValuePools, GENERATOR_POOL_CARDINALITY
+from data_generator.template_store import TemplateStore
+from common.lru_cache import LRUCache
+from common.confluence_client import ConfluenceClient
+
+STREAM_CHUNK_BYTES = 64 * 1024
+# "faker" calls Faker for every value; "pooled" samples from pre-generated values per field
+GENERATION_MODES = ("faker", "pooled")
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "generated")
+GENERATOR_OUTPUT_DIR = os.getenv("GENERATOR_OUTPUT_DIR", DEFAULT_OUTPUT_DIR)
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "templates")
+# Empty keeps templates in process memory, where other workers cannot see them
+GENERATOR_TEMPLATE_DIR = os.getenv("GENERATOR_TEMPLATE_DIR", DEFAULT_TEMPLATE_DIR)
+GENERATOR_TEMPLATE_VERSIONS = int(os.getenv("GENERATOR_TEMPLATE_VERSIONS", "10"))
+GENERATOR_MAX_TEMPLATES = int(os.getenv("GENERATOR_MAX_TEMPLATES", "1000"))
+GENERATOR_TEMPLATE_CACHE_SIZE = int(os.getenv("GENERATOR_TEMPLATE_CACHE_SIZE", "256"))
 
 class DataGeneratorService:
     def __init__(self):
         self.faker = Faker()
-        self.templates = {}
+        self.environment = Environment()
+        if GENERATOR_TEMPLATE_DIR:
+            os.makedirs(GENERATOR_TEMPLATE_DIR, exist_ok=True)
+        self.template_store = TemplateStore(
+            os.path.join(GENERATOR_TEMPLATE_DIR, "templates.sqlite") if GENERATOR_TEMPLATE_DIR else ":memory:",
+            GENERATOR_TEMPLATE_VERSIONS,
+            GENERATOR_MAX_TEMPLATES
+        )
+        # Compiled templates of this process by store revision; a changed template has a new revision
+        self.compiled_templates = LRUCache(GENERATOR_TEMPLATE_CACHE_SIZE, name="templates")
+        self.bulk = BulkGenerator()
 
     def load_template(self, template_id, template_content, template_type="json"):
-        """Load a template for generating data"""
-        self.templates[template_id] = {
-            "content": template_content,
-            "type": template_type
+        """Load a template for generating data; loading changed content stores a new version"""
+        try:
+            template_data = self._compile(template_content, template_type)
+        except TemplateSyntaxError as e:
+            return {"status": "error", "message": f"Invalid template: {e}"}
+        
+        try:
+            version, revision = self.template_store.save(template_id, template_content, template_type)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        self.compiled_templates.put(revision, template_data)
+        fields = template_data["faker_fields"]
+        unknown = [field for field in fields if field not in FAKER_FIELDS]
+        return {
+            "status": "success",
+            "message": f"Template {template_id} loaded",
+            "version": version,
+            "faker_fields": fields,
+            "dynamic_faker_access": template_data["dynamic_faker_access"],
+            "unknown_faker_fields": unknown
         }
-        return {"status": "success", "message": f"Template {template_id} loaded"}
 
-    def generate_data(self, template_id, count=1):
-        """Generate data using the specified template"""
-        if template_id not in self.templates:
+    def list_templates(self):
+        """Latest version of every stored template"""
+        return {"status": "success", "templates": self.template_store.list()}
+
+    def get_template(self, template_id, version=None):
+        """Content of a template version (the latest by default) and the versions kept"""
+        template = self.template_store.get(template_id, version)
+        if template is None:
             return {"status": "error", "message": f"Template {template_id} not found"}
-        
-        template_data = self.templates[template_id]
+        template.pop("revision")
+        return {"status": "success", **template, "versions": self.template_store.versions(template_id)}
+
+    def delete_template(self, template_id):
+        """Delete every version of a template"""
+        if not self.template_store.delete(template_id):
+            return {"status": "error", "message": f"Template {template_id} not found"}
+        return {"status": "success", "message": f"Template {template_id} deleted"}
+
+    def get_template_stats(self):
+        return self.compiled_templates.get_stats()
+
+    def generate_data(self, template_id, count=1, mode="faker", cardinality=None, pretty=True):
+        """Generate data using the specified template.
+
+        In "pooled" mode each field takes one of `cardinality` pre-generated values, which is much
+        faster for large counts but repeats values across records. XML records are returned
+        indented unless `pretty` is False.
+        """
+        template_data = self._template(template_id)
+        if template_data is None:
+            return {"status": "error", "message": f"Template {template_id} not found"}
+        error = self._check_mode(mode, cardinality)
+        if error:
+            return {"status": "error", "message": error}
         
         try:
-            template = Template(template_data["content"])
-            results = []
+            if mode == "pooled":
+                pools = self._value_pools(template_data, count, cardinality)
+                results = [render_record(template_data, self.faker, values, pretty) for values in pools.sample(count)]
+            else:
+                results = [self._render_record(template_data, pretty) for _ in range(count)]
             
-            for _ in range(count):
-                # Create a dictionary of faker functions
-                faker_dict = {
-                    "name": self.faker.name(),
-                    "address": self.faker.address(),
-                    "email": self.faker.email(),
-                    "company": self.faker.company(),
-                    "job": self.faker.job(),
-                    "phone": self.faker.phone_number(),
-                    "ssn": self.faker.ssn(),
-                    "date": self.faker.date(),
-                    "time": self.faker.time(),
-                    "datetime": self.faker.date_time().isoformat(),
-                    "uuid": str(self.faker.uuid4()),
-                    "number": self.faker.random_int(min=1, max=100),
-                    "decimal": self.faker.random_number(digits=2) / 100,
-                    "paragraph": self.faker.paragraph(),
-                    "sentence": self.faker.sentence(),
-                    "word": self.faker.word(),
-                    "url": self.faker.url(),
-                    "image_url": self.faker.image_url(),
-                    "ipv4": self.faker.ipv4(),
-                    "ipv6": self.faker.ipv6(),
-                    "user_agent": self.faker.user_agent(),
-                    "color": self.faker.color_name(),
-                    "hex_color": self.faker.hex_color(),
-                    "rgb_color": self.faker.rgb_color(),
-                    "credit_card_number": self.faker.credit_card_number(),
-                    "credit_card_provider": self.faker.credit_card_provider(),
-                    "currency_code": self.faker.currency_code(),
-                    "currency_name": self.faker.currency_name(),
-                    "cryptocurrency_name": self.faker.cryptocurrency_name(),
-                    "cryptocurrency_code": self.faker.cryptocurrency_code(),
-                    "iban": self.faker.iban(),
-                }
-                
-                # Render the template with faker data
-                result = template.render(faker=faker_dict)
-                
-                if template_data["type"].lower() == "json":
-                    # Parse as JSON to ensure validity
-                    result = json.loads(result)
-                elif template_data["type"].lower() == "xml":
-                    # Parse as XML to ensure validity
-                    root = ET.fromstring(result)
-                    result = xml.dom.minidom.parseString(ET.tostring(root)).toprettyxml()
-                
-                results.append(result)
-            
-            return {
+            result = {
                 "status": "success", 
                 "data": results if count > 1 else results[0],
                 "format": template_data["type"]
             }
+            if mode == "pooled":
+                result["cardinality"] = pools.cardinality
+            return result
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
-    def upload_to_confluence(self, page_id, content, content_type, base_url, auth_token):
-        """Upload generated data to Confluence page"""
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            "Content-Type": "application/json"
+    def stream_data(self, template_id, count=1, output_format="ndjson", mode="faker", cardinality=None, pretty=True):
+        """Prepare a stream of `count` records as NDJSON, a JSON array or one XML document.
+
+        On success the result holds a generator of text chunks; records are rendered as it is consumed.
+        """
+        template_data = self._template(template_id)
+        if template_data is None:
+            return {"status": "error", "message": f"Template {template_id} not found"}
+        if output_format not in STREAM_FORMATS:
+            return {"status": "error", "message": f"Unknown output format {output_format}, expected one of {', '.join(STREAM_FORMATS)}"}
+        error = self._check_mode(mode, cardinality)
+        if error:
+            return {"status": "error", "message": error}
+        
+        if output_format == "xml" and template_data["type"].lower() != "xml":
+            return {"status": "error", "message": "XML output needs an XML template"}
+        
+        return {
+            "status": "success",
+            "stream": self._stream_chunks(template_data, count, output_format, mode, cardinality, pretty),
+            "media_type": STREAM_FORMATS[output_format]
         }
+
+    def bulk_generate(self, template_id, count, output_format="ndjson", seed=None, output_file=None):
+        """Generate `count` records on a process pool, reproducibly for a given `seed`.
+
+        The output depends only on the template, count, format and seed, never on the number of
+        workers. Without `output_file` the result holds a generator of text chunks; otherwise the
+        records are written to that file under GENERATOR_OUTPUT_DIR.
+        """
+        template_data = self._template(template_id)
+        if template_data is None:
+            return {"status": "error", "message": f"Template {template_id} not found"}
+        if output_format not in STREAM_FORMATS:
+            return {"status": "error", "message": f"Unknown output format {output_format}, expected one of {', '.join(STREAM_FORMATS)}"}
         
-        # First, get the current version of the page
-        version_url = f"{base_url}/rest/api/content/{page_id}"
+        if output_format == "xml" and template_data["type"].lower() != "xml":
+            return {"status": "error", "message": "XML output needs an XML template"}
+        if seed is None:
+            seed = secrets.randbits(63)
+        
+        chunks = self.bulk.iter_chunks(template_data["content"], template_data["type"], output_format, seed, count)
+        if not output_file:
+            return {
+                "status": "success",
+                "stream": chunks,
+                "media_type": STREAM_FORMATS[output_format],
+                "seed": seed
+            }
+        
+        name = os.path.basename(output_file)
+        if name in ("", ".", ".."):
+            chunks.close()
+            return {"status": "error", "message": f"Invalid output file name {output_file}"}
+        os.makedirs(GENERATOR_OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(GENERATOR_OUTPUT_DIR, name)
+        partial = f"{path}.{os.getpid()}.part"
+        started = time.monotonic()
+        try:
+            # Written under a temporary name so readers never see a half-written file
+            with open(partial, "w", encoding="utf-8") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(partial, path)
+        except Exception as e:
+            chunks.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+            return {"status": "error", "message": str(e)}
+        elapsed = time.monotonic() - started
+        return {
+            "status": "success",
+            "path": path,
+            "count": count,
+            "seed": seed,
+            "seconds": round(elapsed, 2),
+            "records_per_second": round(count / elapsed, 1) if elapsed else None
+        }
+
+    def _stream_chunks(self, template_data, count, output_format, mode="faker", cardinality=None, pretty=True):
+        """Serialized records, buffered into chunks of about STREAM_CHUNK_BYTES"""
+        opening, separator, _ = STREAM_FRAMING[output_format]
+        # Pools are built here, on the worker consuming the stream, not by the caller
+        rows = self._value_pools(template_data, count, cardinality).iter_rows(count) if mode == "pooled" else None
+        buffer = [opening]
+        size = len(opening)
+        for i in range(count):
+            values = next(rows) if rows is not None else None
+            record = serialize_record(template_data, self.faker, output_format, values, pretty)
+            if i:
+                buffer.append(separator)
+            buffer.append(record)
+            size += len(record) + len(separator)
+            # The first record goes out at once so clients see output immediately
+            if i == 0 or size >= STREAM_CHUNK_BYTES:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        buffer.append(closing(output_format, count))
+        yield "".join(buffer)
+
+    def _template(self, template_id):
+        """Compiled latest version of a template, or None when it does not exist"""
+        # One indexed lookup per call keeps every worker on the latest version
+        revision = self.template_store.current_revision(template_id)
+        if revision is None:
+            return None
+        template_data = self.compiled_templates.get(revision)
+        if template_data is None:
+            template = self.template_store.get_revision(revision)
+            if template is None:
+                return None
+            template_data = self._compile(template["content"], template["type"])
+            self.compiled_templates.put(revision, template_data)
+        return template_data
+
+    def _compile(self, template_content, template_type):
+        # Compiled once per process and version rather than on every generate call
+        template_ast = self.environment.parse(template_content)
+        fields, dynamic = referenced_fields(template_ast)
+        return {
+            "content": template_content,
+            "type": template_type,
+            "compiled": self.environment.from_string(template_ast),
+            "faker_fields": fields,
+            "dynamic_faker_access": dynamic,
+            "lazy_faker": lazy_faker_safe(fields, dynamic)
+        }
+
+    def _render_record(self, template_data, pretty=True):
+        return render_record(template_data, self.faker, pretty=pretty)
+
+    def _check_mode(self, mode, cardinality):
+        if mode not in GENERATION_MODES:
+            return f"Unknown mode {mode}, expected one of {', '.join(GENERATION_MODES)}"
+        if cardinality is not None and cardinality < 1:
+            return "Cardinality must be at least 1"
+        return None
+
+    def _value_pools(self, template_data, count, cardinality):
+        # Templates reading faker[key] may use any field
+        fields = FAKER_FIELDS if template_data["dynamic_faker_access"] else template_data["faker_fields"]
+        cardinality = cardinality or GENERATOR_POOL_CARDINALITY
+        # More distinct values than records would never be used
+        return ValuePools(self.faker, fields, max(1, min(cardinality, count)))
+
+    def upload_to_confluence(self, page_id, content, content_type, base_url, auth_token):
+        """Upload generated data to Confluence page"""
         try:
-            response = requests.get(version_url, headers=headers)
-            response.raise_for_status()
-            
-            page_data = response.json()
-            current_version = page_data.get("version", {}).get("number", 1)
-            
             # Prepare content based on type
             if content_type.lower() == "json":
                 formatted_content = f"<ac:structured-macro ac:name=\"code\"><ac:parameter ac:name=\"language\">json</ac:parameter><ac:plain-text-body><![CDATA[{json.dumps(content, indent=2)}]]></ac:plain-text-body></ac:structured-macro>"
             else:  # XML
                 formatted_content = f"<ac:structured-macro ac:name=\"code\"><ac:parameter ac:name=\"language\">xml</ac:parameter><ac:plain-text-body><![CDATA[{content}]]></ac:plain-text-body></ac:structured-macro>"
             
-            # Update the page
-            update_data = {
-                "version": {
-                    "number": current_version + 1
-                },
-                "title": page_data.get("title", "Generated Data"),
-                "type": "page",
-                "body": {
-                    "storage": {
-                        "value": formatted_content,
-                        "representation": "storage"
-                    }
-                }
-            }
-            
-            update_url = f"{base_url}/rest/api/content/{page_id}"
-            update_response = requests.put(
-                update_url, 
-                headers=headers, 
-                data=json.dumps(update_data)
-            )
-            update_response.raise_for_status()
+            result = ConfluenceClient(base_url, auth_token).replace_page_body(page_id, formatted_content, "Generated Data")
             
-            return {"status": "success", "message": "Data uploaded to Confluence"}
+            return {
+                "status": "success",
+                "message": "Data uploaded to Confluence" if result["updated"] else "Data unchanged since the last upload",
+                **result
+            }
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
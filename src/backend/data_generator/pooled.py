@@ -0,0 +1,57 @@
+"""
+Pooled values
+Pre-generate a fixed pool of values per Faker field and assemble rows by vectorized sampling.
+"""
+import os
+import numpy as np
+from data_generator.faker_fields import FAKER_FIELDS
+
+# Distinct values generated per field unless the request sets its own cardinality
+GENERATOR_POOL_CARDINALITY = int(os.getenv("GENERATOR_POOL_CARDINALITY", "1000"))
+# Rows sampled at once when records are consumed one by one
+POOLED_BLOCK_ROWS = 4096
+
+# Fields drawn directly as whole arrays, with the same ranges as FAKER_FIELDS
+NUMERIC_FIELDS = {
+    "number": lambda rng, count: rng.integers(1, 101, count),
+    "decimal": lambda rng, count: rng.integers(0, 100, count) / 100,
+}
+
+
+class ValuePools:
+    """`cardinality` pre-generated values for each field; rows pick from them uniformly at random.
+
+    Fewer distinct values make pools cheaper to build but repeat values (names, emails, even
+    UUIDs) across rows; numeric fields are not pooled and keep their full range.
+    """
+
+    def __init__(self, faker, fields, cardinality, seed=None):
+        self.cardinality = cardinality
+        self.rng = np.random.default_rng(seed)
+        self.pools = {}
+        self.numeric = []
+        for field in fields:
+            if field in NUMERIC_FIELDS:
+                self.numeric.append(field)
+            elif field in FAKER_FIELDS:
+                pool = np.empty(cardinality, dtype=object)
+                pool[:] = [FAKER_FIELDS[field](faker) for _ in range(cardinality)]
+                self.pools[field] = pool
+
+    def sample(self, count):
+        """`count` rows as dicts of field -> value"""
+        columns = {
+            field: pool[self.rng.integers(0, len(pool), count)].tolist()
+            for field, pool in self.pools.items()
+        }
+        for field in self.numeric:
+            columns[field] = NUMERIC_FIELDS[field](self.rng, count).tolist()
+        if not columns:
+            return [{} for _ in range(count)]
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+    def iter_rows(self, count, block_rows=POOLED_BLOCK_ROWS):
+        """Rows sampled in blocks of `block_rows`"""
+        for start in range(0, count, block_rows):
+            yield from self.sample(min(block_rows, count - start))
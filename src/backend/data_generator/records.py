@@ -0,0 +1,63 @@
+"""
+Records
+Render one record from a compiled template and serialize it for the streaming output formats.
+"""
+import json
+import xml.etree.ElementTree as ET
+from data_generator.faker_fields import LazyFakerFields, faker_values
+from data_generator.xml_output import pretty_xml, compact_xml
+
+# Streaming output formats and their media types
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "xml": "application/xml"
+}
+# (opening, separator between records, closing) of each output format
+STREAM_FRAMING = {
+    "ndjson": ("", "\n", "\n"),
+    "json": ("[\n", ",\n", "\n]\n"),
+    "xml": ('<?xml version="1.0" encoding="utf-8"?>\n<records>\n', "\n", "\n</records>\n")
+}
+
+
+def render_record(template_data, faker, values=None, pretty=True):
+    """Render one record and parse it according to the template type.
+
+    `values` are precomputed `faker.*` values (pooled mode); by default they come from `faker`.
+    XML records are indented unless `pretty` is False, in which case they are only validated.
+    """
+    if template_data["type"].lower() == "xml":
+        # Validated (and indented) in one parse
+        text = _render(template_data, faker, values)
+        return pretty_xml(text) if pretty else compact_xml(text)
+
+    result = _render(template_data, faker, values)
+    if template_data["type"].lower() == "json":
+        # Parse as JSON to ensure validity
+        return json.loads(result)
+    return result
+
+
+def render_element(template_data, faker, values=None):
+    return ET.fromstring(_render(template_data, faker, values))
+
+
+def serialize_record(template_data, faker, output_format, values=None, pretty=True):
+    """One record as an NDJSON line, a JSON array item or an XML element"""
+    if output_format == "xml":
+        return ET.tostring(render_element(template_data, faker, values), encoding="unicode")
+    return json.dumps(render_record(template_data, faker, values, pretty))
+
+
+def closing(output_format, count):
+    """Closing text of a stream of `count` records"""
+    text = STREAM_FRAMING[output_format][2]
+    return text if count else text.lstrip("\n")
+
+
+def _render(template_data, faker, values):
+    if values is None:
+        # Faker values are generated only for the fields the template reads, when those are known
+        values = LazyFakerFields(faker) if template_data.get("lazy_faker") else faker_values(faker)
+    return template_data["compiled"].render(faker=values)
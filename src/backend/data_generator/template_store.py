@@ -0,0 +1,187 @@
+"""
+Template store
+SQLite-backed, versioned generator templates shared by every worker process that serves the same data directory.
+"""
+import time
+import sqlite3
+import threading
+
+_COLUMNS = "template_id, version, revision, content, template_type, created_at"
+# Use of a template is recorded at most this often per process, so lookups rarely write
+USAGE_RESOLUTION_SECONDS = 60
+
+
+class TemplateStore:
+    def __init__(self, path=":memory:", max_versions=10, max_templates=1000):
+        self.path = path
+        # Older versions of a template beyond this many are deleted
+        self.max_versions = max(1, int(max_versions))
+        # Beyond this many templates, the least recently used ones are deleted
+        self.max_templates = max(1, int(max_templates))
+        self._touched = {}
+        # Autocommit; saves open their own IMMEDIATE transaction so version numbers never collide
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            # `revision` is never reused, even after a template is deleted and saved again,
+            # so it safely identifies compiled templates cached by other processes
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS templates (
+                    revision INTEGER PRIMARY KEY AUTOINCREMENT,
+                    template_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    template_type TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (template_id, version)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS template_usage (
+                    template_id TEXT PRIMARY KEY,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS template_usage_last_used ON template_usage (last_used)")
+            # Templates stored before usage was tracked count as used when last saved
+            self._conn.execute(
+                "INSERT OR IGNORE INTO template_usage (template_id, last_used) "
+                "SELECT template_id, MAX(created_at) FROM templates GROUP BY template_id"
+            )
+
+    def save(self, template_id, content, template_type):
+        """Store a new version of a template and return (version, revision); an unchanged template keeps its version"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT version, revision, content, template_type FROM templates WHERE template_id = ? "
+                    "ORDER BY version DESC LIMIT 1",
+                    (template_id,)
+                ).fetchone()
+                if row is not None and row[2] == content and row[3] == template_type:
+                    version, revision = row[0], row[1]
+                else:
+                    version = row[0] + 1 if row is not None else 1
+                    cursor = self._conn.execute(
+                        "INSERT INTO templates (template_id, version, content, template_type, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (template_id, version, content, template_type, time.time())
+                    )
+                    revision = cursor.lastrowid
+                    self._conn.execute(
+                        "DELETE FROM templates WHERE template_id = ? AND version <= ?",
+                        (template_id, version - self.max_versions)
+                    )
+                now = time.time()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO template_usage (template_id, last_used) VALUES (?, ?)",
+                    (template_id, now)
+                )
+                self._touched[template_id] = now
+                self._evict_least_used()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return version, revision
+
+    def current_revision(self, template_id, version=None):
+        """Revision of a template version (the latest by default), or None when there is none"""
+        with self._lock:
+            if version is None:
+                row = self._conn.execute(
+                    "SELECT revision FROM templates WHERE template_id = ? ORDER BY version DESC LIMIT 1",
+                    (template_id,)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT revision FROM templates WHERE template_id = ? AND version = ?",
+                    (template_id, int(version))
+                ).fetchone()
+            if row is not None:
+                self._touch(template_id)
+        return row[0] if row else None
+
+    def get_revision(self, revision):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM templates WHERE revision = ?", (revision,)).fetchone()
+        return self._row_to_template(row) if row else None
+
+    def get(self, template_id, version=None):
+        """One version of a template (the latest by default), or None"""
+        with self._lock:
+            if version is None:
+                row = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM templates WHERE template_id = ? ORDER BY version DESC LIMIT 1",
+                    (template_id,)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM templates WHERE template_id = ? AND version = ?",
+                    (template_id, int(version))
+                ).fetchone()
+        return self._row_to_template(row) if row else None
+
+    def list(self):
+        """Latest version of every template, without content"""
+        with self._lock:
+            rows = self._conn.execute(
+                # SQLite takes the bare columns from the row holding MAX(version)
+                "SELECT template_id, MAX(version), template_type, created_at FROM templates "
+                "GROUP BY template_id ORDER BY template_id"
+            ).fetchall()
+        return [
+            {"template_id": row[0], "version": row[1], "type": row[2], "updated_at": row[3]}
+            for row in rows
+        ]
+
+    def versions(self, template_id):
+        """Version numbers and timestamps kept for a template, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, created_at FROM templates WHERE template_id = ? ORDER BY version DESC",
+                (template_id,)
+            ).fetchall()
+        return [{"version": row[0], "created_at": row[1]} for row in rows]
+
+    def delete(self, template_id):
+        """Delete every version of a template; returns False when it did not exist"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM templates WHERE template_id = ?", (template_id,))
+            self._conn.execute("DELETE FROM template_usage WHERE template_id = ?", (template_id,))
+            self._touched.pop(template_id, None)
+        return cursor.rowcount > 0
+
+    def _touch(self, template_id):
+        """Record that a template was used; callers hold self._lock"""
+        now = time.time()
+        if now - self._touched.get(template_id, 0.0) < USAGE_RESOLUTION_SECONDS:
+            return
+        self._touched[template_id] = now
+        self._conn.execute(
+            "UPDATE template_usage SET last_used = MAX(last_used, ?) WHERE template_id = ?", (now, template_id)
+        )
+
+    def _evict_least_used(self):
+        """Delete the least recently used templates beyond max_templates; runs inside a save"""
+        evicted = self._conn.execute(
+            "SELECT template_id FROM template_usage ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+            (self.max_templates,)
+        ).fetchall()
+        for (template_id,) in evicted:
+            self._conn.execute("DELETE FROM templates WHERE template_id = ?", (template_id,))
+            self._conn.execute("DELETE FROM template_usage WHERE template_id = ?", (template_id,))
+            self._touched.pop(template_id, None)
+
+    def _row_to_template(self, row):
+        return {
+            "template_id": row[0],
+            "version": row[1],
+            "revision": row[2],
+            "content": row[3],
+            "type": row[4],
+            "created_at": row[5]
+        }
@@ -0,0 +1,82 @@
+"""
+XML benchmark
+Compare records/sec and peak memory of the minidom round-trip with the single-pass pretty and compact paths.
+
+Usage (from the backend folder):
+    python -m data_generator.xml_benchmark --records 2000 --depth 3 --breadth 6
+"""
+import time
+import argparse
+import tracemalloc
+import xml.etree.ElementTree as ET
+import xml.dom.minidom
+from jinja2 import Environment
+from faker import Faker
+from data_generator.faker_fields import faker_values
+from data_generator.xml_output import pretty_xml, compact_xml
+
+LEAF_FIELDS = ("name", "email", "company", "address", "uuid", "sentence")
+
+
+def nested_template(depth, breadth):
+    """An XML template `depth` levels deep with `breadth` children per level and faker leaves"""
+    def level(remaining):
+        if remaining == 0:
+            return "".join(f"<{field}>{{{{ faker.{field} }}}}</{field}>" for field in LEAF_FIELDS)
+        children = "".join(f'<item index="{i}">{level(remaining - 1)}</item>' for i in range(breadth))
+        return f"<group level=\"{remaining}\">{children}</group>"
+    return f"<record>{level(depth)}</record>"
+
+
+def minidom_round_trip(text):
+    """The previous path: parse, serialize, parse with minidom, pretty-print"""
+    return xml.dom.minidom.parseString(ET.tostring(ET.fromstring(text))).toprettyxml()
+
+
+PATHS = {
+    "minidom": minidom_round_trip,
+    "pretty": pretty_xml,
+    "compact": compact_xml
+}
+
+
+def benchmark_paths(template, records):
+    """Format the same rendered records with every path; template rendering is not timed"""
+    faker = Faker()
+    compiled = Environment().from_string(template)
+    texts = [compiled.render(faker=faker_values(faker)) for _ in range(records)]
+    average_bytes = sum(len(text) for text in texts) / max(len(texts), 1)
+
+    reports = []
+    for name, format_record in PATHS.items():
+        tracemalloc.start()
+        started = time.perf_counter()
+        for text in texts:
+            format_record(text)
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        reports.append({
+            "path": name,
+            "records_per_second": round(records / max(seconds, 1e-9), 1),
+            "peak_kb": round(peak / 1024, 1),
+            "record_kb": round(average_bytes / 1024, 1)
+        })
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=3, help="Nesting levels of the template")
+    parser.add_argument("--breadth", type=int, default=6, help="Children per level")
+    args = parser.parse_args()
+
+    template = nested_template(args.depth, args.breadth)
+    print(f"{args.records} records, depth={args.depth}, breadth={args.breadth}")
+    for report in benchmark_paths(template, args.records):
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
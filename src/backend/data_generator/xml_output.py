@@ -0,0 +1,82 @@
+"""
+XML output
+Validate and format a rendered XML record in a single expat pass.
+"""
+from xml.parsers import expat
+
+
+def _escape(text):
+    # The same entities minidom writes, for text and attribute values alike
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;").replace(">", "&gt;")
+
+
+class _PrettyWriter:
+    """Expat handlers writing the indented document as elements close"""
+
+    def __init__(self, indent, newl):
+        self.indent = indent
+        self.newl = newl
+        self.out = ['<?xml version="1.0" ?>', newl]
+        # Per open element: [text parts, has child elements]
+        self.stack = []
+
+    def start(self, tag, attributes):
+        if self.stack:
+            self._open_parent()
+        depth = len(self.stack)
+        self.out.append(f"{self.indent * depth}<{tag}")
+        for i in range(0, len(attributes), 2):
+            self.out.append(f' {attributes[i]}="{_escape(attributes[i + 1])}"')
+        self.stack.append([[], False])
+
+    def text(self, data):
+        if self.stack:
+            self.stack[-1][0].append(data)
+
+    def end(self, tag):
+        parts, has_children = self.stack.pop()
+        depth = len(self.stack)
+        if not has_children:
+            # Text-only elements stay on one line, empty ones self-close
+            text = "".join(parts)
+            self.out.append(f">{_escape(text)}</{tag}>{self.newl}" if text else f"/>{self.newl}")
+            return
+        self._flush_text(parts, depth + 1)
+        self.out.append(f"{self.indent * depth}</{tag}>{self.newl}")
+
+    def _open_parent(self):
+        parent = self.stack[-1]
+        if not parent[1]:
+            self.out.append(f">{self.newl}")
+            parent[1] = True
+        self._flush_text(parent[0], len(self.stack))
+
+    def _flush_text(self, parts, depth):
+        # Mixed content text gets its own line; whitespace between elements is dropped
+        text = "".join(parts).strip()
+        parts.clear()
+        if text:
+            self.out.append(f"{self.indent * depth}{_escape(text)}{self.newl}")
+
+
+def pretty_xml(text, indent="\t", newl="\n"):
+    """Parse `text` and return it indented, in the layout of minidom's toprettyxml.
+
+    Raises expat.ExpatError for malformed XML. Comments and processing instructions are dropped,
+    as the ElementTree round-trip this replaces did.
+    """
+    writer = _PrettyWriter(indent, newl)
+    parser = expat.ParserCreate()
+    parser.ordered_attributes = True
+    parser.buffer_text = True
+    parser.StartElementHandler = writer.start
+    parser.EndElementHandler = writer.end
+    parser.CharacterDataHandler = writer.text
+    parser.Parse(text, True)
+    return "".join(writer.out)
+
+
+def compact_xml(text):
+    """Check that `text` is well-formed and return it unchanged apart from surrounding whitespace"""
+    expat.ParserCreate().Parse(text, True)
+    return text.strip()
@@ -0,0 +1,93 @@
+"""
+Audio windows
+Spool uploads to disk, decode them with ffmpeg and cut the audio into overlapping windows.
+"""
+import os
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+
+# Whisper's native input rate and window length
+SAMPLE_RATE = 16000
+WINDOW_SECONDS = float(os.getenv("TRANSCRIBE_WINDOW_SECONDS", "30"))
+OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "5"))
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# Trailing bytes of ffmpeg's error output reported when decoding fails
+FFMPEG_ERROR_TAIL_BYTES = 4096
+
+
+def spool_upload(upload, filename=None, directory=None):
+    """Copy an uploaded file object to a temporary file in chunks; returns its path"""
+    suffix = os.path.splitext(filename or "")[1] or ".mp3"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as spooled:
+        shutil.copyfileobj(upload, spooled, SPOOL_CHUNK_BYTES)
+        return spooled.name
+
+
+def decode_windows(path, window_seconds=WINDOW_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """Yield (start_seconds, samples, is_last) for overlapping windows of 16 kHz mono audio.
+
+    ffmpeg streams the decoded audio, so at most one window and one step are held in memory.
+    """
+    window = int(window_seconds * SAMPLE_RATE)
+    overlap = min(int(overlap_seconds * SAMPLE_RATE), window // 2)
+    step = window - overlap
+    # A file rather than a pipe: a damaged input can log more than a pipe holds while we read stdout
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+         "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        stdout=subprocess.PIPE,
+        stderr=stderr
+    )
+    try:
+        buffer = np.empty(0, dtype='float32')
+        start = 0
+        pending = None
+        while True:
+            chunk = process.stdout.read(step * 4)
+            if chunk:
+                buffer = np.concatenate([buffer, np.frombuffer(chunk, dtype='<f4')])
+            while len(buffer) >= window:
+                # One window of lookahead tells the caller which window is the last
+                if pending is not None:
+                    yield pending[0] / SAMPLE_RATE, pending[1], False
+                pending = (start, buffer[:window])
+                buffer = buffer[step:]
+                start += step
+            if not chunk:
+                break
+        # Only a stream read to the end says whether decoding failed; a closed one was cut short
+        returncode = process.wait()
+        if returncode != 0:
+            stderr.seek(max(0, stderr.seek(0, os.SEEK_END) - FFMPEG_ERROR_TAIL_BYTES))
+            errors = stderr.read().decode(errors="replace").strip()
+            detail = f": {errors}" if errors else f" (exit status {returncode})"
+            raise RuntimeError(f"ffmpeg could not decode the audio{detail}")
+
+        # The tail is already covered by the previous window when it is no longer than the overlap
+        if len(buffer) > overlap or (pending is None and len(buffer)):
+            if pending is not None:
+                yield pending[0] / SAMPLE_RATE, pending[1], False
+            pending = (start, buffer)
+        if pending is not None:
+            yield pending[0] / SAMPLE_RATE, pending[1], True
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            # The consumer stopped early (e.g. the job was cancelled)
+            process.kill()
+        process.wait()
+        stderr.close()
+
+
+def owned_range(start, is_last, window_seconds=WINDOW_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """Time range whose segments a window keeps when windows are stitched.
+
+    Each overlap is split at its midpoint, so every moment belongs to exactly one window.
+    """
+    overlap = min(overlap_seconds, window_seconds / 2)
+    owned_start = start + overlap / 2 if start > 0 else 0.0
+    owned_end = float("inf") if is_last else start + window_seconds - overlap / 2
+    return owned_start, owned_end
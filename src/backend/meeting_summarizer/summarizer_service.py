@@ -4,57 +4,262 @@ AI Meeting Summarizer
 Convert meeting audio/text to summaries and update Confluence.
 """
 import os
-import tempfile
+import hashlib
+import itertools
+import threading
 import torch
-from transformers import pipeline, AutoModelForSeq2SeqLM, AutoTokenizer
-import requests
-import json
 import markdown
+from common.model_registry import (
+    registry, SUMMARIZER_MODEL, SUMMARIZER_BACKEND, TRANSCRIPTION_MODEL, TRANSCRIPTION_BACKEND
+)
+from common.inference_cache import InferenceCache, cache_key, text_sha256, file_sha256
+from common.lru_cache import LRUCache
+from common.job_queue import JobCancelled
+from common.confluence_client import ConfluenceClient
+from meeting_summarizer.audio_windows import (
+    SAMPLE_RATE, WINDOW_SECONDS, OVERLAP_SECONDS, spool_upload, decode_windows, owned_range
+)
+from meeting_summarizer.text_chunks import split_token_chunks
+
+# Windows transcribed together in one Whisper call
+TRANSCRIBE_BATCH_SIZE = int(os.getenv("TRANSCRIBE_BATCH_SIZE", "4"))
+# BART's input window, less its two special tokens
+SUMMARY_INPUT_TOKENS = 1022
+# Long texts are cut into chunks of this many tokens, summarized SUMMARY_BATCH_SIZE at a time
+SUMMARY_CHUNK_TOKENS = min(int(os.getenv("SUMMARY_CHUNK_TOKENS", "900")), SUMMARY_INPUT_TOKENS)
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "4"))
+# Chunk summaries use fixed lengths so they can be reused whatever length the caller asks for
+SUMMARY_CHUNK_MAX_LENGTH = int(os.getenv("SUMMARY_CHUNK_MAX_LENGTH", "200"))
+SUMMARY_CHUNK_MIN_LENGTH = int(os.getenv("SUMMARY_CHUNK_MIN_LENGTH", "50"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "4096"))
 
 class MeetingSummarizerService:
     def __init__(self):
-        # Load whisper model for transcription
-        self.transcriber = pipeline("automatic-speech-recognition", model="openai/whisper-base")
-        
-        # Load BART model for summarization
-        self.summarizer_model = AutoModelForSeq2SeqLM.from_pretrained("facebook/bart-large-cnn")
-        self.summarizer_tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
+        # Keyed by chunk text; the model and chunk lengths are fixed for the process
+        self.chunk_summary_cache = LRUCache(SUMMARY_CACHE_MAX_ENTRIES, name="summary-chunks")
+        # Transcriptions and summaries, on disk and shared with other processes
+        self.inference_cache = InferenceCache(name="meeting")
+        # Audio hash -> progress callbacks of every request waiting for that transcription
+        self._partial_listeners = {}
+        self._listeners_lock = threading.Lock()
+
+    # Whisper for transcription and BART for summarization are loaded by the shared registry on first use
+    @property
+    def transcriber(self):
+        return registry.get("transcriber")
+
+    @property
+    def summarizer_model(self):
+        return registry.get("summarizer-model")
 
-    def transcribe_audio(self, audio_file):
+    @property
+    def summarizer_tokenizer(self):
+        return registry.get("summarizer-tokenizer")
+
+    def transcribe_audio(self, audio_file, filename=None):
         """Transcribe audio file to text using Whisper"""
         try:
-            # Create temporary file for uploaded audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_audio:
-                temp_audio.write(audio_file.read())
-                temp_audio_path = temp_audio.name
-            
-            # Transcribe audio with whisper
-            result = self.transcriber(temp_audio_path)
-            transcription = result.get("text", "")
+            # Spool the upload to disk in chunks rather than reading it into memory
+            audio_path = spool_upload(audio_file, filename)
+            return self.transcribe_file(audio_path, delete_audio=True)
+        
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def transcribe_file(self, audio_path, on_partial=None, check_cancelled=None, delete_audio=False):
+        """Transcribe an audio file on disk; `on_partial(event)` is called as each window completes.
+
+        Identical audio is transcribed once: results are cached and concurrent requests coalesced.
+        `check_cancelled()` is called between windows and while waiting for an identical request;
+        the JobCancelled it raises propagates.
+        """
+        try:
+            key = self._transcription_key(audio_path)
+            self._add_listener(key, on_partial)
+            try:
+                return self.inference_cache.get_or_compute(
+                    key, lambda: self._transcribe(audio_path, key, check_cancelled), wait=check_cancelled
+                )
+            finally:
+                self._remove_listener(key, on_partial)
+        
+        except JobCancelled:
+            raise
+        
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        
+        finally:
+            if delete_audio and os.path.exists(audio_path):
+                os.unlink(audio_path)
+
+    def _add_listener(self, key, on_partial):
+        if on_partial is None:
+            return
+        with self._listeners_lock:
+            self._partial_listeners.setdefault(key, []).append(on_partial)
+
+    def _remove_listener(self, key, on_partial):
+        if on_partial is None:
+            return
+        with self._listeners_lock:
+            listeners = self._partial_listeners[key]
+            listeners.remove(on_partial)
+            if not listeners:
+                del self._partial_listeners[key]
+
+    def _publish_partial(self, key, event):
+        with self._listeners_lock:
+            listeners = list(self._partial_listeners.get(key, ()))
+        for on_partial in listeners:
+            try:
+                on_partial(event)
+            except Exception:
+                # One request's progress reporting must not fail a transcription others share
+                pass
+
+    def _transcription_key(self, audio_path):
+        return cache_key(
+            "transcribe",
+            f"{TRANSCRIPTION_MODEL}/{TRANSCRIPTION_BACKEND}",
+            {"window_seconds": WINDOW_SECONDS, "overlap_seconds": OVERLAP_SECONDS},
+            file_sha256(audio_path)
+        )
+
+    def _transcribe(self, audio_path, key, check_cancelled):
+        try:
+            for event in self._transcription_events(audio_path):
+                if event["event"] == "partial":
+                    self._publish_partial(key, event)
+                    if check_cancelled is not None:
+                        check_cancelled()
+                elif event["event"] == "error":
+                    return {"status": "error", "message": event["message"]}
+                elif event["event"] == "done":
+                    return {
+                        "status": "success",
+                        "transcription": event["transcription"],
+                        "segments": event["segments"]
+                    }
+        
+        except JobCancelled:
+            raise
+        
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def transcribe_audio_stream(self, audio_path, delete_audio=True):
+        """Yield a partial transcript per window as batches finish, then the stitched transcript.
+
+        With delete_audio the file at audio_path is deleted once the stream ends.
+        """
+        try:
+            key = self._transcription_key(audio_path)
+            cached = self.inference_cache.get(key)
+            if cached is not None:
+                yield {"event": "done", "transcription": cached["transcription"], "segments": cached["segments"]}
+                return
             
-            # Clean up temporary file
-            os.unlink(temp_audio_path)
+            for event in self._transcription_events(audio_path):
+                if event["event"] == "done":
+                    self.inference_cache.put(key, {
+                        "status": "success",
+                        "transcription": event["transcription"],
+                        "segments": event["segments"]
+                    })
+                yield event
+        
+        except Exception as e:
+            yield {"event": "error", "message": str(e)}
+        
+        finally:
+            if delete_audio and os.path.exists(audio_path):
+                os.unlink(audio_path)
+
+    def _transcription_events(self, audio_path):
+        """Partial and final transcription events, then an error event if decoding or inference fails"""
+        try:
+            segments = []
+            windows = decode_windows(audio_path)
+            while True:
+                batch = list(itertools.islice(windows, TRANSCRIBE_BATCH_SIZE))
+                if not batch:
+                    break
+                results = self.transcriber(
+                    [{"raw": samples, "sampling_rate": SAMPLE_RATE} for _, samples, _ in batch],
+                    batch_size=len(batch),
+                    return_timestamps=True
+                )
+                for (start, samples, is_last), result in zip(batch, results):
+                    end = start + len(samples) / SAMPLE_RATE
+                    window_segments = self._window_segments(start, end, is_last, result)
+                    segments.extend(window_segments)
+                    yield {
+                        "event": "partial",
+                        "start": round(start, 2),
+                        "end": round(end, 2),
+                        "text": " ".join(segment["text"] for segment in window_segments),
+                        "segments": window_segments
+                    }
             
-            return {"status": "success", "transcription": transcription}
+            yield {
+                "event": "done",
+                "transcription": " ".join(segment["text"] for segment in segments),
+                "segments": segments
+            }
         
         except Exception as e:
-            return {"status": "error", "message": str(e)}
+            yield {"event": "error", "message": str(e)}
+
+    @staticmethod
+    def _window_segments(start, end, is_last, result):
+        """Timestamped segments of one window that fall in the part of the audio it owns"""
+        owned_start, owned_end = owned_range(start, is_last)
+        chunks = result.get("chunks") or [{"timestamp": (0.0, end - start), "text": result.get("text", "")}]
+        segments = []
+        for chunk in chunks:
+            chunk_start, chunk_end = chunk["timestamp"]
+            segment_start = start + (chunk_start or 0.0)
+            segment_end = start + chunk_end if chunk_end is not None else end
+            text = chunk["text"].strip()
+            if text and owned_start <= segment_start < owned_end:
+                segments.append({"start": round(segment_start, 2), "end": round(segment_end, 2), "text": text})
+        return segments
 
     def summarize_text(self, text, max_length=150, min_length=50):
-        """Summarize text using BART model"""
+        """Summarize text using BART model; identical requests share one cached result"""
+        key = cache_key(
+            "summarize",
+            f"{SUMMARIZER_MODEL}/{SUMMARIZER_BACKEND}",
+            {
+                "max_length": max_length,
+                "min_length": min_length,
+                "chunk_tokens": SUMMARY_CHUNK_TOKENS,
+                "chunk_max_length": SUMMARY_CHUNK_MAX_LENGTH,
+                "chunk_min_length": SUMMARY_CHUNK_MIN_LENGTH
+            },
+            text_sha256(text)
+        )
+        return self.inference_cache.get_or_compute(key, lambda: self._summarize(text, max_length, min_length))
+
+    def _summarize(self, text, max_length, min_length):
+        """Text longer than BART's window is summarized map-reduce style: token-bounded chunks are
+        summarized in batches, and the chunk summaries are reduced until one pass fits.
+        """
         try:
-            # Tokenize and generate summary
-            inputs = self.summarizer_tokenizer(text, return_tensors="pt", max_length=1024, truncation=True)
-            
-            summary_ids = self.summarizer_model.generate(
-                inputs.input_ids, 
-                max_length=max_length,
-                min_length=min_length,
-                do_sample=False,
-                num_beams=4
-            )
+            chunks = [text]
+            levels = 0
+            while self._count_tokens([" ".join(chunks)])[0] > SUMMARY_INPUT_TOKENS:
+                joined = " ".join(chunks)
+                chunks = self._summarize_chunks(
+                    split_token_chunks(joined, self._count_tokens, SUMMARY_CHUNK_TOKENS)
+                )
+                levels += 1
+                if len(" ".join(chunks)) >= len(joined):
+                    # Summaries stopped shrinking; the final pass truncates what is left
+                    break
             
-            summary = self.summarizer_tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+            summary = self._generate_summaries([" ".join(chunks)], max_length, min_length)[0]
             
             # Extract key points (simplified approach)
             sentences = summary.split(". ")
@@ -63,12 +268,58 @@ class MeetingSummarizerService:
             return {
                 "status": "success", 
                 "summary": summary,
-                "key_points": key_points
+                "key_points": key_points,
+                "reduce_levels": levels
             }
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+    def _summarize_chunks(self, chunks):
+        """Summarize chunks with fixed lengths, reusing cached summaries of chunks seen before"""
+        keys = [hashlib.sha256(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+        summaries = [self.chunk_summary_cache.get(key) for key in keys]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        for i in range(0, len(missing), SUMMARY_BATCH_SIZE):
+            batch = missing[i:i + SUMMARY_BATCH_SIZE]
+            generated = self._generate_summaries(
+                [chunks[j] for j in batch], SUMMARY_CHUNK_MAX_LENGTH, SUMMARY_CHUNK_MIN_LENGTH
+            )
+            for j, summary in zip(batch, generated):
+                summaries[j] = summary
+                self.chunk_summary_cache.put(keys[j], summary)
+        return summaries
+
+    def _generate_summaries(self, texts, max_length, min_length):
+        """One padded BART generate call over several texts"""
+        summarizer_tokenizer = self.summarizer_tokenizer
+        inputs = summarizer_tokenizer(
+            texts, return_tensors="pt", max_length=SUMMARY_INPUT_TOKENS, truncation=True, padding=True
+        )
+        
+        summary_ids = self.summarizer_model.generate(
+            inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False,
+            num_beams=4
+        )
+        return summarizer_tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
+
+    def _count_tokens(self, texts):
+        """BART token counts, without special tokens"""
+        encoded = self.summarizer_tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def get_stats(self):
+        """Chunk summary and inference cache statistics"""
+        return {
+            "status": "success",
+            "chunk_summary_cache": self.chunk_summary_cache.get_stats(),
+            "inference_cache": self.inference_cache.get_stats()
+        }
+
     def generate_markdown_report(self, meeting_data):
         """Generate markdown report from meeting data"""
         markdown_content = f"""# Meeting Summary: {meeting_data.get('title', 'Untitled Meeting')}
@@ -101,48 +352,17 @@ class MeetingSummarizerService:
 
     def upload_to_confluence(self, page_id, markdown_content, base_url, auth_token):
         """Upload markdown summary to Confluence"""
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # First, get the current version of the page
-        version_url = f"{base_url}/rest/api/content/{page_id}"
-        
         try:
-            response = requests.get(version_url, headers=headers)
-            response.raise_for_status()
-            
-            page_data = response.json()
-            current_version = page_data.get("version", {}).get("number", 1)
-            
             # Convert markdown to HTML
             html_content = markdown.markdown(markdown_content)
             
-            # Update the page
-            update_data = {
-                "version": {
-                    "number": current_version + 1
-                },
-                "title": page_data.get("title", "Meeting Summary"),
-                "type": "page",
-                "body": {
-                    "storage": {
-                        "value": html_content,
-                        "representation": "storage"
-                    }
-                }
-            }
+            result = ConfluenceClient(base_url, auth_token).replace_page_body(page_id, html_content, "Meeting Summary")
             
-            update_url = f"{base_url}/rest/api/content/{page_id}"
-            update_response = requests.put(
-                update_url, 
-                headers=headers, 
-                data=json.dumps(update_data)
-            )
-            update_response.raise_for_status()
-            
-            return {"status": "success", "message": "Summary uploaded to Confluence"}
+            return {
+                "status": "success",
+                "message": "Summary uploaded to Confluence" if result["updated"] else "Summary unchanged since the last upload",
+                **result
+            }
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
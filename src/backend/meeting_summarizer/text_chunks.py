@@ -0,0 +1,41 @@
+"""
+Text chunks
+Split long text into sentence-aligned chunks that fit a model's token window.
+"""
+import re
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_token_chunks(text, count_tokens, max_tokens):
+    """Greedily pack sentences into chunks of at most `max_tokens` tokens.
+
+    `count_tokens(texts)` returns one token count per text. A sentence longer than
+    `max_tokens` is split between words in proportion to its token count.
+    """
+    sentences = [sentence for sentence in _SENTENCE_RE.split(text.strip()) if sentence]
+    if not sentences:
+        return []
+
+    pieces = []
+    for sentence, tokens in zip(sentences, count_tokens(sentences)):
+        if tokens <= max_tokens:
+            pieces.append((sentence, tokens))
+            continue
+        words = sentence.split()
+        words_per_piece = max(1, int(len(words) * max_tokens / tokens))
+        for i in range(0, len(words), words_per_piece):
+            piece = words[i:i + words_per_piece]
+            pieces.append((" ".join(piece), min(max_tokens, -(-tokens * len(piece) // len(words)))))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece, tokens in pieces:
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
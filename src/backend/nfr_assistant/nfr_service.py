@@ -5,21 +5,21 @@ Track Non-Functional Requirements with exportable documentation.
 """
 import os
 import yaml
-import json
 import tempfile
+import threading
 from docx import Document
 from fpdf import FPDF
 import markdown
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
 from bs4 import BeautifulSoup
-import requests
+from common.model_registry import registry, shared_embedding_batcher
+from common.confluence_client import ConfluenceClient
 
 class NFRService:
     def __init__(self):
-        # Load model for semantic search
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Concurrent single-requirement encodes are coalesced into one model call
+        self.embedding_batcher = shared_embedding_batcher
         
         # Sample NFR categories and their descriptions
         self.nfr_categories = {
@@ -33,8 +33,13 @@ class NFRService:
             "compliance": "Requirements related to regulatory, legal, or industry standards."
         }
         
-        # Initialize index and embeddings for NFR categories
-        self._create_embeddings()
+        # Index and embeddings for NFR categories are built on the first suggestion
+        self.category_index = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        return registry.get("embedding")
 
     def _create_embeddings(self):
         """Create embeddings for NFR categories and descriptions"""
@@ -51,11 +56,15 @@ class NFRService:
         if not requirement_text:
             return None
             
+        with self._index_lock:
+            if self.category_index is None:
+                self._create_embeddings()
+
         # Get query embedding
-        query_embedding = self.embedding_model.encode([requirement_text])
+        query_embedding = self.embedding_batcher.run(requirement_text)
         
         # Search in FAISS index
-        distances, indices = self.category_index.search(np.array(query_embedding).astype('float32'), 3)
+        distances, indices = self.category_index.search(query_embedding[None, :], 3)
         
         suggestions = []
         categories = list(self.nfr_categories.keys())
@@ -199,48 +208,17 @@ class NFRService:
 
     def upload_to_confluence(self, page_id, markdown_content, base_url, auth_token):
         """Upload NFR documentation to Confluence"""
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # First, get the current version of the page
-        version_url = f"{base_url}/rest/api/content/{page_id}"
-        
         try:
-            response = requests.get(version_url, headers=headers)
-            response.raise_for_status()
-            
-            page_data = response.json()
-            current_version = page_data.get("version", {}).get("number", 1)
-            
             # Convert markdown to HTML
             html_content = markdown.markdown(markdown_content)
             
-            # Update the page
-            update_data = {
-                "version": {
-                    "number": current_version + 1
-                },
-                "title": page_data.get("title", "Non-Functional Requirements"),
-                "type": "page",
-                "body": {
-                    "storage": {
-                        "value": html_content,
-                        "representation": "storage"
-                    }
-                }
-            }
+            result = ConfluenceClient(base_url, auth_token).replace_page_body(page_id, html_content, "Non-Functional Requirements")
             
-            update_url = f"{base_url}/rest/api/content/{page_id}"
-            update_response = requests.put(
-                update_url, 
-                headers=headers, 
-                data=json.dumps(update_data)
-            )
-            update_response.raise_for_status()
-            
-            return {"status": "success", "message": "NFR documentation uploaded to Confluence"}
+            return {
+                "status": "success",
+                "message": "NFR documentation uploaded to Confluence" if result["updated"] else "NFR documentation unchanged since the last upload",
+                **result
+            }
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
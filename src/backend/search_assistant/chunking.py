@@ -0,0 +1,42 @@
+"""
+Passage chunking
+Split page text into overlapping word windows that fit the embedding model's input.
+"""
+import os
+import re
+
+# all-MiniLM-L6-v2 reads 256 word pieces; ~180 words stays inside that for typical prose
+PASSAGE_WORDS = int(os.getenv("SEARCH_PASSAGE_WORDS", "180"))
+PASSAGE_OVERLAP = int(os.getenv("SEARCH_PASSAGE_OVERLAP", "40"))
+
+# Passage ids pack the page's doc id above a per-page passage number
+PASSAGE_BITS = 16
+MAX_PASSAGES_PER_PAGE = 1 << PASSAGE_BITS
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def split_passages(text, passage_words=PASSAGE_WORDS, overlap_words=PASSAGE_OVERLAP):
+    """Return (start_char, end_char) spans of overlapping passages covering `text`"""
+    words = [match.span() for match in _WORD_RE.finditer(text)]
+    if not words:
+        # Keep title-only pages searchable through a single empty passage
+        return [(0, 0)]
+
+    step = max(1, passage_words - overlap_words)
+    spans = []
+    for start in range(0, len(words), step):
+        window = words[start:start + passage_words]
+        spans.append((window[0][0], window[-1][1]))
+        if start + passage_words >= len(words) or len(spans) == MAX_PASSAGES_PER_PAGE:
+            break
+    return spans
+
+
+def passage_id(doc_id, passage_number):
+    return (int(doc_id) << PASSAGE_BITS) | passage_number
+
+
+def passage_doc_ids(passage_ids):
+    """Map an array of passage ids back to the doc ids of their pages"""
+    return passage_ids >> PASSAGE_BITS
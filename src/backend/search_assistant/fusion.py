@@ -0,0 +1,30 @@
+"""
+Result fusion
+Combine ranked passage lists from the vector and lexical indexes.
+"""
+import os
+
+RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """Score each passage by the sum of 1 / (k + rank) over the lists it appears in"""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, (pid, _) in enumerate(ranked, start=1):
+            scores[pid] = scores.get(pid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(vector_hits, lexical_hits, alpha):
+    """Blend min-max normalized scores: alpha * vector + (1 - alpha) * lexical"""
+    scores = {}
+    for weight, hits in ((alpha, vector_hits), (1 - alpha, lexical_hits)):
+        if not hits:
+            continue
+        values = [score for _, score in hits]
+        low, high = min(values), max(values)
+        span = (high - low) or 1.0
+        for pid, score in hits:
+            scores[pid] = scores.get(pid, 0.0) + weight * (score - low) / span
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
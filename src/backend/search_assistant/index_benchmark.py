@@ -0,0 +1,107 @@
+"""
+Index benchmark
+Report recall and query latency of flat, IVF and HNSW settings on the same embeddings.
+
+Usage (from the backend folder):
+    python -m search_assistant.index_benchmark --index-dir data/search_index
+    python -m search_assistant.index_benchmark --synthetic 200000
+"""
+import time
+import argparse
+import numpy as np
+import faiss
+from search_assistant.vector_index import VectorIndex, BUILD_SETTINGS
+from search_assistant.index_store import IndexStore
+
+
+def default_settings_grid():
+    """Settings compared when none are given: flat, IVF over nprobe, HNSW over efSearch"""
+    grid = [{"index_type": "flat"}]
+    grid += [{"index_type": "ivf", "nprobe": nprobe} for nprobe in (1, 4, 16, 64)]
+    grid += [{"index_type": "hnsw", "ef_search": ef} for ef in (16, 64, 256)]
+    return grid
+
+
+def benchmark_settings(embeddings, queries, settings_grid=None, top_k=10):
+    """Build each index once per structural setting and measure recall@k and latency per query"""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    ids = np.arange(len(embeddings), dtype='int64')
+
+    # Exact neighbours are the reference for recall
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, top_k)
+
+    built = {}
+    reports = []
+    for settings in settings_grid or default_settings_grid():
+        vector_index = VectorIndex(settings)
+        build_key = tuple(vector_index.settings[key] for key in BUILD_SETTINGS)
+        build_seconds = 0.0
+        if build_key not in built:
+            started = time.perf_counter()
+            vector_index.add(ids, embeddings)
+            build_seconds = time.perf_counter() - started
+            built[build_key] = vector_index
+        vector_index = built[build_key]
+
+        latencies = []
+        hits = 0
+        for i, query in enumerate(queries):
+            started = time.perf_counter()
+            _, found = vector_index.search(
+                query[None, :], top_k,
+                nprobe=settings.get("nprobe"),
+                ef_search=settings.get("ef_search")
+            )
+            latencies.append(time.perf_counter() - started)
+            hits += len(np.intersect1d(found[0], truth[i]))
+
+        latencies_ms = np.array(latencies) * 1000
+        reports.append({
+            "settings": settings,
+            "built_type": vector_index.built_type,
+            "build_seconds": round(build_seconds, 3),
+            f"recall_at_{top_k}": round(hits / (len(queries) * top_k), 4),
+            "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+            "qps": round(len(queries) / max(sum(latencies), 1e-9), 1)
+        })
+    return reports
+
+
+def _sample_queries(embeddings, count, seed=0):
+    """Perturbed corpus vectors stand in for real queries near the data"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=min(count, len(embeddings)), replace=False)
+    noise = rng.normal(scale=0.05, size=(len(rows), embeddings.shape[1])).astype('float32')
+    return np.asarray(embeddings[rows], dtype='float32') + noise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--index-dir", help="Persisted search index (SEARCH_INDEX_DIR) to benchmark")
+    source.add_argument("--synthetic", type=int, help="Number of random 384-d vectors to benchmark")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.index_dir:
+        vector_index, _, _ = IndexStore(args.index_dir).load(mmap=True)
+        if vector_index is None:
+            parser.error(f"No published index in {args.index_dir}")
+        embeddings = vector_index.embeddings
+    else:
+        embeddings = np.random.default_rng(0).normal(size=(args.synthetic, 384)).astype('float32')
+
+    queries = _sample_queries(embeddings, args.queries)
+    print(f"{len(embeddings)} vectors, {len(queries)} queries, top_k={args.top_k}")
+    for report in benchmark_settings(embeddings, queries, top_k=args.top_k):
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Index store
+Persists generations of the vector index on disk and publishes them atomically.
+"""
+import os
+import shutil
+import fcntl
+import threading
+from contextlib import contextmanager
+from search_assistant.vector_index import VectorIndex, META_FILE
+from search_assistant.lexical_index import LexicalIndex
+
+CURRENT_FILE = "CURRENT"
+
+
+class IndexStore:
+    def __init__(self, root_dir, keep_generations=2):
+        self.root_dir = root_dir
+        self.keep_generations = max(1, keep_generations)
+        self._thread_lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    @property
+    def page_store_path(self):
+        return os.path.join(self.root_dir, "pages.sqlite")
+
+    def current_generation(self):
+        """Return the published generation number, or None when nothing was saved yet"""
+        try:
+            with open(os.path.join(self.root_dir, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load(self, mmap=True):
+        """Load the published generation; returns (vector_index, lexical_index, generation)
+
+        The lexical index is None for generations written before it existed.
+        """
+        generation = self.current_generation()
+        if generation is None:
+            return None, None, None
+        directory = self._generation_dir(generation)
+        if not os.path.exists(os.path.join(directory, META_FILE)):
+            # Written before passage-level ids; the next sync rebuilds it
+            return None, None, None
+        return VectorIndex.load(directory, mmap=mmap), LexicalIndex.load(directory, mmap=mmap), generation
+
+    def save(self, vector_index, lexical_index=None):
+        """Write a new generation and make it current; returns the generation number"""
+        # Past any generation left unpublished by a crash between the rename and CURRENT
+        generation = max([self.current_generation() or 0, *self._generations()]) + 1
+        final_dir = self._generation_dir(generation)
+        tmp_dir = f"{final_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        vector_index.save(tmp_dir)
+        if lexical_index is not None:
+            lexical_index.save(tmp_dir)
+        os.rename(tmp_dir, final_dir)
+
+        # Readers only ever see a complete generation
+        current_tmp = os.path.join(self.root_dir, f"{CURRENT_FILE}.tmp")
+        with open(current_tmp, "w") as f:
+            f.write(str(generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(self.root_dir, CURRENT_FILE))
+
+        self._prune(generation)
+        return generation
+
+    @contextmanager
+    def writer_lock(self):
+        """Serialize index writers across threads and worker processes"""
+        with self._thread_lock:
+            with open(os.path.join(self.root_dir, ".lock"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _generation_dir(self, generation):
+        return os.path.join(self.root_dir, f"gen-{generation:06d}")
+
+    def _generations(self):
+        """Generation numbers of the complete generation directories on disk"""
+        generations = []
+        for name in os.listdir(self.root_dir):
+            if not name.startswith("gen-") or name.endswith(".tmp"):
+                continue
+            try:
+                generations.append(int(name[len("gen-"):]))
+            except ValueError:
+                continue
+        return generations
+
+    def _prune(self, current):
+        # Mapped files of older generations stay readable until every worker has reloaded
+        for generation in self._generations():
+            if generation <= current - self.keep_generations:
+                shutil.rmtree(self._generation_dir(generation), ignore_errors=True)
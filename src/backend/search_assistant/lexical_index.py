@@ -0,0 +1,292 @@
+"""
+Lexical index
+BM25 over an inverted index: a compacted CSR segment plus a delta of recent changes, merged once it grows.
+"""
+import os
+import re
+import json
+from array import array
+from collections import Counter
+import numpy as np
+
+BM25_K1 = float(os.getenv("SEARCH_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("SEARCH_BM25_B", "0.75"))
+MAX_TF = 65535
+# The delta and deleted passages are merged into the segment once they exceed this share of
+# its passages (and at least LEXICAL_COMPACT_MIN_CHANGES), not on every sync
+LEXICAL_COMPACT_RATIO = float(os.getenv("SEARCH_LEXICAL_COMPACT_RATIO", "0.1"))
+LEXICAL_COMPACT_MIN_CHANGES = int(os.getenv("SEARCH_LEXICAL_COMPACT_MIN_CHANGES", "1000"))
+
+TERMS_FILE = "lexical_terms.json"
+ARRAY_FILES = ("offsets", "post_ids", "post_tfs", "post_lens", "doc_ids", "doc_lens")
+DELTA_FILE = "lexical_delta.npz"
+
+# Identifiers such as JIRA-1234, ERR_CONN_RESET or v2.3.1 are kept whole as well as split
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[-_.:/][0-9a-z]+)*")
+_PART_RE = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text):
+    """Lowercased word tokens; compound identifiers also yield their parts"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_PART_RE.findall(token))
+    return tokens
+
+
+def _concat_buffers(buffers, dtype):
+    if not buffers:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate([np.frombuffer(buffer, dtype=dtype) for buffer in buffers])
+
+
+class LexicalIndex:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        # Compacted segment: postings of term i live in [offsets[i], offsets[i + 1])
+        self.terms = {}
+        self.offsets = np.zeros(1, dtype='int64')
+        self.post_ids = np.empty(0, dtype='int64')
+        self.post_tfs = np.empty(0, dtype='uint16')
+        self.post_lens = np.empty(0, dtype='uint32')
+        # Sorted passage ids of the segment and their lengths, for removals
+        self.doc_ids = np.empty(0, dtype='int64')
+        self.doc_lens = np.empty(0, dtype='uint32')
+        # Changes since the last compaction
+        self.delta_postings = {}
+        self.delta_lens = {}
+        self.deleted = set()
+        self._deleted_array = None
+        self.doc_count = 0
+        self.total_length = 0
+
+    def __len__(self):
+        return self.doc_count
+
+    def copy(self):
+        """A copy to modify while searches keep using this index; swap it in once updated"""
+        clone = LexicalIndex(self.k1, self.b)
+        # Segment arrays are replaced on compaction, never modified, so they can be shared
+        for name in ("terms", "offsets", "post_ids", "post_tfs", "post_lens", "doc_ids", "doc_lens"):
+            setattr(clone, name, getattr(self, name))
+        clone.delta_postings = {
+            term: tuple(array(column.typecode, column) for column in postings)
+            for term, postings in self.delta_postings.items()
+        }
+        clone.delta_lens = dict(self.delta_lens)
+        clone.deleted = set(self.deleted)
+        clone.doc_count = self.doc_count
+        clone.total_length = self.total_length
+        return clone
+
+    def add(self, passage_ids, texts):
+        """Index passages; they are searchable immediately"""
+        delta_postings = self.delta_postings
+        for pid, text in zip(passage_ids, texts):
+            pid = int(pid)
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self.delta_lens[pid] = length
+            self.doc_count += 1
+            self.total_length += length
+            for term, tf in counts.items():
+                postings = delta_postings.get(term)
+                if postings is None:
+                    postings = delta_postings[term] = (array('q'), array('H'), array('I'))
+                ids, tfs, lens = postings
+                ids.append(pid)
+                tfs.append(tf if tf < MAX_TF else MAX_TF)
+                lens.append(length)
+
+    def remove(self, passage_ids):
+        """Drop passages; their postings are skipped until the next compaction"""
+        for pid in passage_ids:
+            pid = int(pid)
+            if pid in self.deleted:
+                continue
+            if pid in self.delta_lens:
+                length = self.delta_lens.pop(pid)
+            else:
+                i = np.searchsorted(self.doc_ids, pid)
+                if i >= len(self.doc_ids) or self.doc_ids[i] != pid:
+                    continue
+                length = int(self.doc_lens[i])
+            self.deleted.add(pid)
+            self.doc_count -= 1
+            self.total_length -= length
+        self._deleted_array = None
+
+    def needs_compaction(self):
+        changes = len(self.delta_lens) + len(self.deleted)
+        return changes > max(LEXICAL_COMPACT_RATIO * len(self.doc_ids), LEXICAL_COMPACT_MIN_CHANGES)
+
+    def maybe_compact(self):
+        """Compact once enough has changed; returns True when it did"""
+        if not self.needs_compaction():
+            return False
+        self.compact()
+        return True
+
+    def compact(self):
+        """Merge the delta into a new segment and purge deleted postings"""
+        if not self.delta_postings and not self.deleted:
+            return
+        names = sorted(self.terms, key=self.terms.get)
+        term_ids = [np.repeat(np.arange(len(names), dtype='int64'), np.diff(self.offsets))]
+        ids, tfs, lens = [self.post_ids], [self.post_tfs], [self.post_lens]
+        for term, (delta_ids, delta_tfs, delta_lens) in self.delta_postings.items():
+            term_id = self.terms.get(term)
+            if term_id is None:
+                term_id = len(names)
+                names.append(term)
+            term_ids.append(np.full(len(delta_ids), term_id, dtype='int64'))
+            ids.append(np.frombuffer(delta_ids, dtype='int64'))
+            tfs.append(np.frombuffer(delta_tfs, dtype='uint16'))
+            lens.append(np.frombuffer(delta_lens, dtype='uint32'))
+        term_ids = np.concatenate(term_ids)
+        ids, tfs, lens = np.concatenate(ids), np.concatenate(tfs), np.concatenate(lens)
+
+        deleted = np.fromiter(self.deleted, dtype='int64', count=len(self.deleted))
+        if len(deleted):
+            keep = ~np.isin(ids, deleted)
+            term_ids, ids, tfs, lens = term_ids[keep], ids[keep], tfs[keep], lens[keep]
+        # Group postings by term; the sort is stable, so segment postings stay ahead of newer ones
+        order = np.argsort(term_ids, kind='stable')
+        counts = np.bincount(term_ids, minlength=len(names))
+        live = np.flatnonzero(counts)
+
+        doc_ids = np.concatenate([self.doc_ids, np.fromiter(self.delta_lens, dtype='int64')])
+        doc_lens = np.concatenate([self.doc_lens, np.fromiter(self.delta_lens.values(), dtype='uint32')])
+        keep = ~np.isin(doc_ids, deleted)
+        doc_order = np.argsort(doc_ids[keep], kind='stable')
+
+        self.terms = {names[i]: n for n, i in enumerate(live)}
+        self.offsets = np.concatenate([[0], np.cumsum(counts[live])]).astype('int64')
+        self.post_ids = ids[order]
+        self.post_tfs = tfs[order]
+        self.post_lens = lens[order]
+        self.doc_ids = doc_ids[keep][doc_order]
+        self.doc_lens = doc_lens[keep][doc_order]
+        self.delta_postings = {}
+        self.delta_lens = {}
+        self.deleted = set()
+        self._deleted_array = None
+
+    def _postings(self, term):
+        """Return (ids, tfs, lens) for a term across the segment and the delta"""
+        parts = []
+        term_id = self.terms.get(term)
+        if term_id is not None:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            parts.append((self.post_ids[start:end], self.post_tfs[start:end], self.post_lens[start:end]))
+        delta = self.delta_postings.get(term)
+        if delta is not None:
+            parts.append((
+                np.frombuffer(delta[0], dtype='int64'),
+                np.frombuffer(delta[1], dtype='uint16'),
+                np.frombuffer(delta[2], dtype='uint32')
+            ))
+        if not parts:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='uint16'), np.empty(0, dtype='uint32')
+        if len(parts) == 1:
+            return parts[0]
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def search(self, query, top_k):
+        """Return [(passage_id, bm25_score)] for the best `top_k` passages"""
+        if not self.doc_count:
+            return []
+        postings = [self._postings(term) for term in set(tokenize(query))]
+        if self.deleted:
+            # Deleted passages stay in the postings until compaction; leave them out of df too
+            if self._deleted_array is None:
+                self._deleted_array = np.fromiter(self.deleted, dtype='int64', count=len(self.deleted))
+            live = []
+            for ids, tfs, lens in postings:
+                keep = ~np.isin(ids, self._deleted_array)
+                live.append((ids[keep], tfs[keep], lens[keep]))
+            postings = live
+        postings = [p for p in postings if len(p[0])]
+        if not postings:
+            return []
+
+        avg_length = self.total_length / self.doc_count
+        id_parts = []
+        score_parts = []
+        for ids, tfs, lens in postings:
+            df = len(ids)
+            idf = np.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            tf = tfs.astype('float32')
+            norm = self.k1 * (1 - self.b + self.b * lens.astype('float32') / avg_length)
+            id_parts.append(ids)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+        ids, inverse = np.unique(np.concatenate(id_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def save(self, directory):
+        """Write the segment, the delta and the deleted passages into `directory`"""
+        with open(os.path.join(directory, TERMS_FILE), "w") as f:
+            json.dump({
+                "terms": sorted(self.terms, key=self.terms.get),
+                "delta_terms": list(self.delta_postings),
+                "doc_count": self.doc_count,
+                "total_length": self.total_length,
+                "k1": self.k1,
+                "b": self.b
+            }, f)
+        for name in ARRAY_FILES:
+            np.save(os.path.join(directory, f"lexical_{name}.npy"), getattr(self, name))
+
+        delta = list(self.delta_postings.values())
+        np.savez(
+            os.path.join(directory, DELTA_FILE),
+            offsets=np.cumsum([0] + [len(ids) for ids, _, _ in delta]).astype('int64'),
+            ids=_concat_buffers([ids for ids, _, _ in delta], 'int64'),
+            tfs=_concat_buffers([tfs for _, tfs, _ in delta], 'uint16'),
+            lens=_concat_buffers([lens for _, _, lens in delta], 'uint32'),
+            doc_ids=np.fromiter(self.delta_lens, dtype='int64', count=len(self.delta_lens)),
+            doc_lens=np.fromiter(self.delta_lens.values(), dtype='uint32', count=len(self.delta_lens)),
+            deleted=np.fromiter(self.deleted, dtype='int64', count=len(self.deleted))
+        )
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved index, memory-mapping the segment; returns None if none was saved"""
+        terms_path = os.path.join(directory, TERMS_FILE)
+        if not os.path.exists(terms_path):
+            return None
+        with open(terms_path) as f:
+            meta = json.load(f)
+        lexical_index = cls(k1=meta["k1"], b=meta["b"])
+        lexical_index.terms = {term: i for i, term in enumerate(meta["terms"])}
+        lexical_index.doc_count = meta["doc_count"]
+        lexical_index.total_length = meta["total_length"]
+        for name in ARRAY_FILES:
+            path = os.path.join(directory, f"lexical_{name}.npy")
+            setattr(lexical_index, name, np.load(path, mmap_mode='r' if mmap else None))
+
+        delta_path = os.path.join(directory, DELTA_FILE)
+        if os.path.exists(delta_path):
+            # Small by construction, so it is read into memory where it can keep growing
+            with np.load(delta_path) as delta:
+                offsets = delta["offsets"]
+                for i, term in enumerate(meta["delta_terms"]):
+                    start, end = offsets[i], offsets[i + 1]
+                    lexical_index.delta_postings[term] = (
+                        array('q', delta["ids"][start:end].tobytes()),
+                        array('H', delta["tfs"][start:end].tobytes()),
+                        array('I', delta["lens"][start:end].tobytes())
+                    )
+                lexical_index.delta_lens = dict(zip(delta["doc_ids"].tolist(), delta["doc_lens"].tolist()))
+                lexical_index.deleted = set(delta["deleted"].tolist())
+        return lexical_index
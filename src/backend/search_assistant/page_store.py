@@ -0,0 +1,189 @@
+"""
+Page store
+SQLite-backed page metadata shared by every worker that serves the same index.
+"""
+import zlib
+import sqlite3
+import threading
+from search_assistant.chunking import passage_id
+
+
+class PageStore:
+    def __init__(self, path=":memory:"):
+        self.path = path
+        # One connection guarded by a lock; ":memory:" databases are private to their connection
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    doc_id INTEGER PRIMARY KEY,
+                    page_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    version INTEGER,
+                    content_hash TEXT NOT NULL,
+                    content BLOB NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS pages_page_id ON pages (page_id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS passages (
+                    passage_id INTEGER PRIMARY KEY,
+                    doc_id INTEGER NOT NULL,
+                    start_char INTEGER NOT NULL,
+                    end_char INTEGER NOT NULL,
+                    token_count INTEGER
+                )
+            """)
+            # Stores created before token counts were recorded gain the column here
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(passages)")]
+            if "token_count" not in columns:
+                self._conn.execute("ALTER TABLE passages ADD COLUMN token_count INTEGER")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS passages_doc_id ON passages (doc_id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT page_id) FROM pages").fetchone()[0]
+
+    def get_index_state(self, indexed_doc_ids):
+        """Return {page_id: {doc_id, version, content_hash}} for pages present in the index"""
+        indexed_doc_ids = set(indexed_doc_ids)
+        state = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, page_id, version, content_hash FROM pages ORDER BY doc_id")
+            for doc_id, page_id, version, content_hash in rows:
+                if doc_id in indexed_doc_ids:
+                    state[page_id] = {"doc_id": doc_id, "version": version, "content_hash": content_hash}
+        return state
+
+    def get_orphan_doc_ids(self, indexed_doc_ids):
+        """Return doc ids stored here but missing from the index (e.g. after an interrupted sync)"""
+        indexed_doc_ids = set(indexed_doc_ids)
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id FROM pages").fetchall()
+        return [doc_id for (doc_id,) in rows if doc_id not in indexed_doc_ids]
+
+    def get_pages(self, doc_ids):
+        """Return {doc_id: page} for the requested doc ids"""
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, page_id, title, url, version, content_hash, content "
+                f"FROM pages WHERE doc_id IN ({placeholders})",
+                doc_ids
+            ).fetchall()
+        return {row[0]: self._row_to_page(row) for row in rows}
+
+    def get_passages(self, passage_ids):
+        """Return {passage_id: {doc_id, start, end, token_count}} for the requested passages"""
+        passage_ids = [int(pid) for pid in passage_ids]
+        if not passage_ids:
+            return {}
+        placeholders = ",".join("?" * len(passage_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT passage_id, doc_id, start_char, end_char, token_count "
+                f"FROM passages WHERE passage_id IN ({placeholders})",
+                passage_ids
+            ).fetchall()
+        return {
+            pid: {"doc_id": doc_id, "start": start, "end": end, "token_count": token_count}
+            for pid, doc_id, start, end, token_count in rows
+        }
+
+    def get_passage_spans(self, doc_ids):
+        """Return {doc_id: [(passage_id, start, end)]} for the requested pages"""
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        spans = {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT passage_id, doc_id, start_char, end_char FROM passages "
+                f"WHERE doc_id IN ({placeholders}) ORDER BY passage_id",
+                doc_ids
+            ).fetchall()
+        for pid, doc_id, start, end in rows:
+            spans.setdefault(doc_id, []).append((pid, start, end))
+        return spans
+
+    def allocate_doc_ids(self, count):
+        """Reserve `count` consecutive doc ids, unique across every process sharing the store"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'next_doc_id'").fetchone()
+            first = row[0] if row else 0
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_doc_id', ?)",
+                (first + count,)
+            )
+        return list(range(first, first + count))
+
+    def insert_pages(self, pages):
+        """Insert page records that already carry their doc id and passage spans"""
+        passage_rows = [
+            (passage_id(page["doc_id"], number), page["doc_id"], start, end, token_count)
+            for page in pages
+            for number, ((start, end), token_count) in enumerate(zip(
+                page.get("passages", []),
+                page.get("passage_token_counts") or [None] * len(page.get("passages", []))
+            ))
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (doc_id, page_id, title, url, version, content_hash, content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._page_to_row(page) for page in pages]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO passages (passage_id, doc_id, start_char, end_char, token_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                passage_rows
+            )
+
+    def update_versions(self, pages):
+        """Update the stored version of pages whose text did not change"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE pages SET version = ?, title = ?, url = ? WHERE doc_id = ?",
+                [(page["version"], page["title"], page["url"], page["doc_id"]) for page in pages]
+            )
+
+    def delete_doc_ids(self, doc_ids):
+        rows = [(int(doc_id),) for doc_id in doc_ids]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM pages WHERE doc_id = ?", rows)
+            self._conn.executemany("DELETE FROM passages WHERE doc_id = ?", rows)
+
+    @staticmethod
+    def _page_to_row(page):
+        # Page text is stored zlib-compressed to keep the shared file small
+        return (
+            page["doc_id"],
+            page["id"],
+            page["title"],
+            page["url"],
+            page["version"],
+            page["content_hash"],
+            zlib.compress(page["content"].encode("utf-8"))
+        )
+
+    @staticmethod
+    def _row_to_page(row):
+        doc_id, page_id, title, url, version, content_hash, content = row
+        return {
+            "doc_id": doc_id,
+            "id": page_id,
+            "title": title,
+            "url": url,
+            "version": version,
+            "content_hash": content_hash,
+            "content": zlib.decompress(content).decode("utf-8")
+        }
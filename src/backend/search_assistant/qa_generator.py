@@ -0,0 +1,145 @@
+"""
+QA generation
+Batches concurrent FLAN-T5 answer requests and streams tokens for single requests.
+"""
+import os
+import time
+import threading
+from collections import deque
+import numpy as np
+from transformers import TextIteratorStreamer
+from common.micro_batcher import MicroBatcher
+from common.model_registry import registry
+
+QA_NUM_BEAMS = int(os.getenv("QA_NUM_BEAMS", "4"))
+QA_BATCH_MAX_SIZE = int(os.getenv("QA_BATCH_MAX_SIZE", "8"))
+QA_BATCH_MAX_WAIT_MS = float(os.getenv("QA_BATCH_MAX_WAIT_MS", "10"))
+# A streaming request whose next token takes longer than this is abandoned
+QA_STREAM_TIMEOUT_SECONDS = float(os.getenv("QA_STREAM_TIMEOUT_SECONDS", "60"))
+ANSWER_MAX_LENGTH = 100
+ANSWER_MIN_LENGTH = 30
+# Completed answers within this window count towards answers/sec
+THROUGHPUT_WINDOW_SECONDS = 60
+LATENCY_WINDOW = 1000
+
+
+class QAGenerator:
+    def __init__(self, max_input_tokens=512):
+        self.max_input_tokens = max_input_tokens
+        # Requests only share a batch when their decoding settings match
+        self.batcher = MicroBatcher(
+            self._generate_batch,
+            max_batch_size=QA_BATCH_MAX_SIZE,
+            max_wait_ms=QA_BATCH_MAX_WAIT_MS,
+            name="qa-generation",
+            batch_key=lambda request: request[1:]
+        )
+        self._stats_lock = threading.Lock()
+        self._completed_at = deque()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._first_token_latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def tokenizer(self):
+        return registry.get("qa-tokenizer")
+
+    @property
+    def model(self):
+        return registry.get("qa-model")
+
+    def generate(self, input_text, num_beams=None, max_length=ANSWER_MAX_LENGTH, min_length=ANSWER_MIN_LENGTH):
+        """Generate one answer; concurrent calls are decoded together as a padded batch"""
+        started = time.monotonic()
+        answer = self.batcher.run((input_text, max(1, num_beams or QA_NUM_BEAMS), max_length, min_length))
+        self._record(started)
+        return answer
+
+    def stream(self, input_text, max_length=ANSWER_MAX_LENGTH, min_length=ANSWER_MIN_LENGTH):
+        """Yield answer text as it is decoded; streaming always decodes greedily"""
+        started = time.monotonic()
+        tokenizer, model = self.tokenizer, self.model
+        inputs = tokenizer(
+            input_text, return_tensors="pt", max_length=self.max_input_tokens, truncation=True
+        )
+        streamer = TextIteratorStreamer(
+            tokenizer, skip_special_tokens=True, timeout=QA_STREAM_TIMEOUT_SECONDS
+        )
+        errors = []
+
+        def run_generate():
+            try:
+                model.generate(
+                    inputs.input_ids,
+                    attention_mask=inputs.attention_mask,
+                    max_length=max_length,
+                    min_length=min_length,
+                    do_sample=False,
+                    num_beams=1,
+                    streamer=streamer
+                )
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer loop below
+                streamer.end()
+
+        thread = threading.Thread(target=run_generate, name="qa-stream", daemon=True)
+        thread.start()
+
+        first_token_at = None
+        for text in streamer:
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            yield text
+        thread.join()
+
+        if errors:
+            raise errors[0]
+        self._record(started, first_token_at)
+
+    def _generate_batch(self, requests):
+        _, num_beams, max_length, min_length = requests[0]
+        tokenizer = self.tokenizer
+        inputs = tokenizer(
+            [input_text for input_text, _, _, _ in requests],
+            return_tensors="pt",
+            max_length=self.max_input_tokens,
+            truncation=True,
+            padding=True
+        )
+        outputs = self.model.generate(
+            inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False,
+            num_beams=num_beams
+        )
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def _record(self, started, first_token_at=None):
+        now = time.monotonic()
+        with self._stats_lock:
+            self._completed_at.append(now)
+            while self._completed_at and self._completed_at[0] < now - THROUGHPUT_WINDOW_SECONDS:
+                self._completed_at.popleft()
+            self._latencies.append(now - started)
+            # Without streaming the first token reaches the caller with the whole answer
+            self._first_token_latencies.append((first_token_at or now) - started)
+
+    def get_stats(self):
+        """Answers/sec over the last minute, time-to-first-token and batching statistics"""
+        now = time.monotonic()
+        with self._stats_lock:
+            recent = sum(1 for completed in self._completed_at if completed >= now - THROUGHPUT_WINDOW_SECONDS)
+            latencies_ms = np.array(self._latencies) * 1000
+            ttft_ms = np.array(self._first_token_latencies) * 1000
+        return {
+            "answers_per_sec": round(recent / THROUGHPUT_WINDOW_SECONDS, 3),
+            "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 1) if len(latencies_ms) else 0.0,
+            "latency_ms_p95": round(float(np.percentile(latencies_ms, 95)), 1) if len(latencies_ms) else 0.0,
+            "time_to_first_token_ms_p50": round(float(np.percentile(ttft_ms, 50)), 1) if len(ttft_ms) else 0.0,
+            "time_to_first_token_ms_p95": round(float(np.percentile(ttft_ms, 95)), 1) if len(ttft_ms) else 0.0,
+            "batcher": self.batcher.get_stats()
+        }
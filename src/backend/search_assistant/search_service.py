@@ -4,116 +4,525 @@ Search Results - AI Assistant
 Provides semantic search over Confluence pages and QA-based answers.
 """
 import os
-import requests
 import json
+import time
+import hashlib
+import threading
+import contextlib
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from common.model_registry import registry, shared_embedding_batcher, QA_MODEL, QA_BACKEND
+from common.inference_cache import InferenceCache, cache_key, text_sha256
+from common.lru_cache import LRUCache
+from search_assistant.qa_generator import QAGenerator, QA_NUM_BEAMS, ANSWER_MAX_LENGTH, ANSWER_MIN_LENGTH
+from search_assistant.confluence_crawler import ConfluenceCrawler, DEFAULT_PARALLELISM
+from search_assistant.vector_index import VectorIndex, default_index_settings
+from search_assistant.chunking import split_passages, passage_id, passage_doc_ids
+from search_assistant.lexical_index import LexicalIndex
+from search_assistant.fusion import reciprocal_rank_fusion, weighted_fusion
+from search_assistant.index_store import IndexStore
+from search_assistant.page_store import PageStore
+
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "search_index"
+)
+INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", DEFAULT_INDEX_DIR)
+RELOAD_CHECK_SECONDS = float(os.getenv("SEARCH_INDEX_RELOAD_SECONDS", "2"))
+# Passages fetched per requested page before results are aggregated back to pages
+PASSAGE_OVERSAMPLE = int(os.getenv("SEARCH_PASSAGE_OVERSAMPLE", "4"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+# Query embeddings do not depend on the index, so they outlive index changes
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+# FLAN-T5 input window, and passages considered when answers are built from the index
+QA_MAX_INPUT_TOKENS = 512
+RAG_CANDIDATES = int(os.getenv("SEARCH_RAG_CANDIDATES", "20"))
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+FUSION_METHODS = ("rrf", "weighted")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+SEARCH_FUSION = os.getenv("SEARCH_FUSION", "rrf")
+# Weight of the vector side in weighted fusion
+HYBRID_ALPHA = float(os.getenv("SEARCH_HYBRID_ALPHA", "0.5"))
 
 class SearchService:
-    def __init__(self):
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.qa_tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-base")
-        self.qa_model = AutoModelForSeq2SeqLM.from_pretrained("google/flan-t5-base")
-        self.index = None
-        self.pages = []
-        self.page_embeddings = None
-
-    def fetch_confluence_pages(self, base_url, space_key, auth_token):
-        """Fetch pages from Confluence using REST API"""
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            "Content-Type": "application/json"
-        }
+    def __init__(self, index_dir=INDEX_DIR):
+        # Models are loaded by the shared registry on first use
+        self.qa_generator = QAGenerator(QA_MAX_INPUT_TOKENS)
+        # Concurrent single-query encodes are coalesced into one model call
+        self.embedding_batcher = shared_embedding_batcher
         
-        url = f"{base_url}/rest/api/content?spaceKey={space_key}&limit=100&expand=body.storage"
+        # An empty index_dir keeps everything in process memory
+        self.index_store = IndexStore(index_dir) if index_dir else None
+        self.page_store = PageStore(self.index_store.page_store_path if self.index_store else ":memory:")
+        self.index = VectorIndex()
+        # None until rebuilt when a generation saved without one is loaded
+        self.lexical_index = LexicalIndex()
+        self.index_generation = None
+        # Bumped on every index or page change; part of every cached result key
+        self.index_version = 0
+        self.embedding_cache = LRUCache(EMBEDDING_CACHE_MAX_ENTRIES, name="query-embeddings")
+        self.result_cache = LRUCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, name="search-results")
+        # Generated answers, on disk and shared with other processes
+        self.inference_cache = InferenceCache(name="answers")
+        self._last_reload_check = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.last_crawl_stats = None
+        self.last_sync_stats = None
+        
+        # Warm start from the last published generation, memory-mapped
+        self._reload_if_stale(force=True)
+
+    def _reload_if_stale(self, force=False):
+        """Map the latest published index generation if another worker wrote a newer one"""
+        if self.index_store is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < RELOAD_CHECK_SECONDS:
+            return
+        self._last_reload_check = now
+        
+        generation = self.index_store.current_generation()
+        if generation is None or generation == self.index_generation:
+            return
+        vector_index, lexical_index, generation = self.index_store.load()
+        if vector_index is None:
+            return
+        # Query-time settings follow the environment; structural changes wait for the next sync
+        vector_index.apply_settings(default_index_settings(), allow_rebuild=False)
+        with self._lock:
+            self.index = vector_index
+            self.lexical_index = lexical_index
+            self.index_generation = generation
+            self._invalidate_results()
+
+    def fetch_confluence_pages(self, base_url, space_key, auth_token, parallelism=None, incremental=True):
+        """Fetch every page of a space from Confluence and sync the search index"""
+        crawler = ConfluenceCrawler(
+            base_url,
+            auth_token,
+            parallelism=parallelism or DEFAULT_PARALLELISM
+        )
         
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.pages = []
+            raw_pages = crawler.crawl_space(space_key, expand="body.storage,version")
+            fetched = [self._to_page_record(page, base_url, space_key) for page in raw_pages]
             
-            for page in data.get('results', []):
-                page_id = page.get('id')
-                title = page.get('title', '')
-                content = page.get('body', {}).get('storage', {}).get('value', '')
-                
-                # Simple HTML to text conversion (can be improved)
-                content = content.replace('<p>', ' ').replace('</p>', ' ')
-                content = ' '.join(content.split())
-                
-                self.pages.append({
-                    'id': page_id,
-                    'title': title,
-                    'content': content,
-                    'url': f"{base_url}/wiki/spaces/{space_key}/pages/{page_id}"
-                })
+            sync_stats = self._sync_pages(fetched, incremental)
             
-            # Create embeddings for all fetched pages
-            self._create_embeddings()
-            
-            return {"status": "success", "message": f"Fetched {len(self.pages)} pages"}
+            return {
+                "status": "success",
+                "message": f"Fetched {len(fetched)} pages",
+                "crawl_stats": dict(crawler.stats),
+                "sync_stats": sync_stats
+            }
         
         except Exception as e:
             return {"status": "error", "message": str(e)}
+        
+        finally:
+            self.last_crawl_stats = dict(crawler.stats)
 
-    def _create_embeddings(self):
-        """Create embeddings for all the page content"""
-        if not self.pages:
-            return
+    def _to_page_record(self, page, base_url, space_key):
+        """Convert a Confluence content entry into an indexable page record"""
+        page_id = page.get('id')
+        title = page.get('title', '')
+        content = page.get('body', {}).get('storage', {}).get('value', '')
         
-        # Create embeddings for each page
-        texts = [f"{page['title']} {page['content']}" for page in self.pages]
-        self.page_embeddings = self.embedding_model.encode(texts)
+        # Simple HTML to text conversion (can be improved)
+        content = content.replace('<p>', ' ').replace('</p>', ' ')
+        content = ' '.join(content.split())
         
-        # Create FAISS index
-        embedding_dim = self.page_embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(embedding_dim)
-        self.index.add(np.array(self.page_embeddings).astype('float32'))
+        return {
+            'id': page_id,
+            'title': title,
+            'content': content,
+            'url': f"{base_url}/wiki/spaces/{space_key}/pages/{page_id}",
+            'version': page.get('version', {}).get('number'),
+            'content_hash': hashlib.sha256(f"{title}\0{content}".encode('utf-8')).hexdigest()
+        }
+
+    def _sync_pages(self, fetched, incremental=True):
+        """Bring the index in line with the fetched pages, re-embedding only what changed"""
+        with self._sync_lock, self._writer_lock():
+            return self._sync_pages_locked(fetched, incremental)
+
+    def _writer_lock(self):
+        if self.index_store is None:
+            return contextlib.nullcontext()
+        return self.index_store.writer_lock()
+
+    def _sync_pages_locked(self, fetched, incremental):
+        started = time.perf_counter()
+        # Diff against the newest generation, which another worker may have written
+        self._reload_if_stale(force=True)
+        indexed_doc_ids = np.unique(passage_doc_ids(np.asarray(self.index.ids)))
+        
+        previously_indexed = self.page_store.get_index_state(indexed_doc_ids)
+        # A full sync re-embeds every page
+        indexed = previously_indexed if incremental else {}
+        
+        fetched_ids = set()
+        to_embed = []
+        metadata_only = []
+        unchanged = 0
+        
+        for page in fetched:
+            fetched_ids.add(page['id'])
+            existing = indexed.get(page['id'])
+            if existing is None or existing['content_hash'] != page['content_hash']:
+                to_embed.append(page)
+            elif existing['version'] != page['version']:
+                # New version with identical text (e.g. a label change): keep the vectors
+                page['doc_id'] = existing['doc_id']
+                metadata_only.append(page)
+            else:
+                unchanged += 1
+        
+        removed = [page_id for page_id in previously_indexed if page_id not in fetched_ids]
+        if incremental:
+            stale_doc_ids = [indexed[page_id]['doc_id'] for page_id in removed]
+            stale_doc_ids += [indexed[page['id']]['doc_id'] for page in to_embed if page['id'] in indexed]
+        else:
+            stale_doc_ids = [int(doc_id) for doc_id in indexed_doc_ids]
+        # Rows left behind by an interrupted sync are never served; drop them too
+        stale_doc_ids += self.page_store.get_orphan_doc_ids(indexed_doc_ids)
+        stale_passage_ids = np.asarray(self.index.ids)[
+            np.isin(passage_doc_ids(np.asarray(self.index.ids)), stale_doc_ids)
+        ]
+        
+        for page, doc_id in zip(to_embed, self.page_store.allocate_doc_ids(len(to_embed))):
+            page['doc_id'] = doc_id
+        passage_ids, passage_texts = self._split_pages(to_embed)
+        # Encode outside the lock so searches keep running against the current index
+        embeddings = self._encode_texts(passage_texts)
+        
+        if not incremental:
+            lexical_index = LexicalIndex()
+        elif self.lexical_index is None:
+            lexical_index = self._rebuild_lexical_index(set(indexed_doc_ids) - set(stale_doc_ids))
+        else:
+            lexical_index = self.lexical_index.copy()
+        
+        # New rows are invisible until the index referencing them is published,
+        # and old rows are only deleted afterwards, so readers never miss a page.
+        self.page_store.insert_pages(to_embed)
+        
+        # Update copies and swap them in, so searches never wait for a rebuild or retraining
+        updated_index = self.index.copy() if incremental else VectorIndex()
+        rebuilt = updated_index.apply_settings(default_index_settings())
+        updated_index.remove(stale_passage_ids)
+        updated_index.add(passage_ids, embeddings)
+        lexical_index.remove(stale_passage_ids)
+        lexical_index.add(passage_ids, passage_texts)
+        lexical_index.maybe_compact()
+        with self._lock:
+            self.index = updated_index
+            self.lexical_index = lexical_index
+        
+        changed = rebuilt or len(passage_ids) or len(stale_passage_ids)
+        if self.index_store is not None and self.index.dim is not None and changed:
+            self.index_store.save(self.index, self.lexical_index)
+            # Swap the private copy for the shared mapping of what was just written
+            self._reload_if_stale(force=True)
+        
+        self.page_store.update_versions(metadata_only)
+        self.page_store.delete_doc_ids(stale_doc_ids)
+        if changed or metadata_only:
+            with self._lock:
+                self._invalidate_results()
+        
+        self.last_sync_stats = {
+            "mode": "incremental" if incremental else "full",
+            "embedded": len(to_embed),
+            "passages_embedded": len(passage_ids),
+            "metadata_updated": len(metadata_only),
+            "unchanged": unchanged,
+            "removed": len(removed),
+            "index_type": self.index.built_type,
+            "index_rebuilt": bool(rebuilt),
+            "generation": self.index_generation,
+            "sync_seconds": round(time.perf_counter() - started, 3)
+        }
+        return self.last_sync_stats
+
+    def _split_pages(self, pages):
+        """Split pages into overlapping passages; returns (passage_ids, passage_texts)"""
+        passage_ids = []
+        texts = []
+        for page in pages:
+            page['passages'] = split_passages(page['content'])
+            for number, (start, end) in enumerate(page['passages']):
+                passage_ids.append(passage_id(page['doc_id'], number))
+                texts.append(self._passage_text(page, start, end))
+        
+        # Token counts let answer_question pack context without re-tokenizing passages
+        counts = self._count_tokens(texts)
+        offset = 0
+        for page in pages:
+            page['passage_token_counts'] = counts[offset:offset + len(page['passages'])]
+            offset += len(page['passages'])
+        return np.array(passage_ids, dtype='int64'), texts
+
+    @property
+    def embedding_model(self):
+        return registry.get("embedding")
 
-    def search(self, query, top_k=5):
-        """Search for relevant pages using semantic search"""
-        if not self.index or not self.pages:
+    @property
+    def qa_tokenizer(self):
+        return registry.get("qa-tokenizer")
+
+    @staticmethod
+    def _passage_text(page, start, end):
+        # The title travels with every passage so short passages keep their context
+        return f"{page['title']} {page['content'][start:end]}"
+
+    def _encode_texts(self, texts):
+        """Create embeddings for passage texts"""
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        return np.array(self.embedding_model.encode(texts)).astype('float32')
+
+    def _rebuild_lexical_index(self, doc_ids, batch_size=1000):
+        """Build the lexical index for already indexed pages from the page store"""
+        lexical_index = LexicalIndex()
+        doc_ids = sorted(doc_ids)
+        for i in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[i:i + batch_size]
+            pages = self.page_store.get_pages(batch)
+            for doc_id, spans in self.page_store.get_passage_spans(batch).items():
+                page = pages[doc_id]
+                lexical_index.add(
+                    [pid for pid, _, _ in spans],
+                    [self._passage_text(page, start, end) for _, start, end in spans]
+                )
+        return lexical_index
+
+    def _invalidate_results(self):
+        """Drop cached results; callers hold self._lock"""
+        self.index_version += 1
+        self.result_cache.clear()
+
+    def get_stats(self):
+        """Report statistics about the last crawl, the last sync and the current index"""
+        return {
+            "status": "success",
+            "indexed_pages": self.page_store.count(),
+            "index_generation": self.index_generation,
+            "index_memory_mapped": self.index.mapped,
+            "embedding_batcher": self.embedding_batcher.get_stats(),
+            "embedding_cache": self.embedding_cache.get_stats(),
+            "result_cache": self.result_cache.get_stats(),
+            "qa_generator": self.qa_generator.get_stats(),
+            "inference_cache": self.inference_cache.get_stats(),
+            "last_crawl": self.last_crawl_stats,
+            "last_sync": self.last_sync_stats
+        }
+
+    def search(self, query, top_k=5, mode=None, fusion=None, alpha=None):
+        """Search for relevant pages with vector, BM25 or hybrid retrieval over their passages"""
+        mode = mode or SEARCH_MODE
+        fusion = fusion or SEARCH_FUSION
+        alpha = HYBRID_ALPHA if alpha is None else alpha
+        if mode not in SEARCH_MODES:
+            return {"status": "error", "message": f"Unknown search mode: {mode}"}
+        if fusion not in FUSION_METHODS:
+            return {"status": "error", "message": f"Unknown fusion method: {fusion}"}
+        
+        self._reload_if_stale()
+        if not len(self.index):
             return {"status": "error", "message": "No pages indexed"}
         
-        # Get query embedding
-        query_embedding = self.embedding_model.encode([query])
+        # Dashboards repeat the same queries; serve them from the cache until the index changes
+        normalized_query = " ".join(query.lower().split())
+        result_key = (normalized_query, top_k, mode, fusion, alpha, self.index_version)
+        cached = self.result_cache.get(result_key)
+        if cached is not None:
+            return dict(cached)
+        
+        # Several passages of one page can rank high, so over-fetch before aggregating
+        ranked = self._rank_passages(query, top_k * PASSAGE_OVERSAMPLE, mode, fusion, alpha)
         
-        # Search in FAISS index
-        distances, indices = self.index.search(np.array(query_embedding).astype('float32'), top_k)
+        # Keep each page's best passage, in rank order
+        best = {}
+        for pid, score in ranked:
+            doc_id = int(passage_doc_ids(pid))
+            if doc_id not in best:
+                best[doc_id] = (score, pid)
+            if len(best) == top_k:
+                break
+        
+        pages = self.page_store.get_pages(best.keys())
+        passages = self.page_store.get_passages(pid for _, pid in best.values())
         
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.pages):
-                page = self.pages[idx]
-                results.append({
-                    "title": page["title"],
-                    "snippet": page["content"][:200] + "...",
-                    "url": page["url"],
-                    "relevance_score": float(1 / (1 + distances[0][i]))
-                })
-        
-        return {"status": "success", "results": results}
-
-    def answer_question(self, question, context):
-        """Generate an answer using the FLAN-T5 model"""
+        for doc_id, (score, pid) in best.items():
+            page = pages.get(doc_id)
+            if page is None:
+                continue
+            passage = passages.get(pid, {"start": 0, "end": len(page["content"])})
+            results.append({
+                "title": page["title"],
+                "snippet": page["content"][passage["start"]:passage["end"]][:200] + "...",
+                "url": page["url"],
+                "relevance_score": score
+            })
+        
+        result = {"status": "success", "mode": mode, "results": results}
+        self.result_cache.put(result_key, result)
+        return dict(result)
+
+    def _rank_passages(self, query, candidates, mode, fusion, alpha):
+        """Return [(passage_id, score)] best first, from the vector index, BM25 or both"""
+        if mode != "lexical":
+            query_embedding = self._embed_query(" ".join(query.lower().split()))[None, :]
+        
+        vector_hits = []
+        lexical_hits = []
+        # Updates swap in whole new indexes, so searches run on a snapshot without the lock
+        with self._lock:
+            index, lexical_index = self.index, self.lexical_index
+        if mode != "lexical":
+            distances, passage_ids = index.search(query_embedding, candidates)
+            vector_hits = [
+                (int(pid), float(1 / (1 + distance)))
+                for distance, pid in zip(distances[0], passage_ids[0]) if pid >= 0
+            ]
+        if mode != "vector" and lexical_index is not None:
+            lexical_hits = lexical_index.search(query, candidates)
+        
+        if mode == "vector":
+            return vector_hits
+        if mode == "lexical":
+            return lexical_hits
+        if fusion == "weighted":
+            return weighted_fusion(vector_hits, lexical_hits, alpha)
+        return reciprocal_rank_fusion([vector_hits, lexical_hits])
+
+    def _embed_query(self, normalized_query):
+        """Embed a query, reusing the vector of an identical earlier query"""
+        embedding = self.embedding_cache.get(normalized_query)
+        if embedding is None:
+            embedding = self.embedding_batcher.run(normalized_query)
+            self.embedding_cache.put(normalized_query, embedding)
+        return embedding
+
+    def answer_question(self, question, context=None, top_k=None, num_beams=None):
+        """Generate an answer using the FLAN-T5 model.
+
+        Without a context, the most relevant passages are retrieved from the index and
+        packed into the model's input window; the answer then cites them as sources.
+        """
         try:
-            input_text = f"question: {question} context: {context}"
-            inputs = self.qa_tokenizer(input_text, return_tensors="pt", max_length=512, truncation=True)
-            
-            outputs = self.qa_model.generate(
-                inputs.input_ids,
-                max_length=100,
-                min_length=30,
-                do_sample=False,
-                num_beams=4,
+            input_text, sources = self._prepare_answer(question, context, top_k)
+            num_beams = max(1, num_beams or QA_NUM_BEAMS)
+            # Keyed by the full model input, so retrieved context that changes with the index misses
+            answer = self.inference_cache.get_or_compute(
+                self._answer_key(input_text, num_beams),
+                lambda: {"status": "success", "answer": self.qa_generator.generate(input_text, num_beams)}
             )
-            
-            answer = self.qa_tokenizer.decode(outputs[0], skip_special_tokens=True)
-            return {"status": "success", "answer": answer}
+            result = {"status": "success", "answer": answer["answer"]}
+            if sources is not None:
+                result["sources"] = sources
+            return result
         
         except Exception as e:
             return {"status": "error", "message": str(e)}
+
+    def answer_question_stream(self, question, context=None, top_k=None):
+        """Yield answer events: the sources (when retrieved), each decoded piece of text, then done"""
+        try:
+            input_text, sources = self._prepare_answer(question, context, top_k)
+            if sources is not None:
+                yield {"event": "sources", "sources": sources}
+            
+            # Streaming decodes greedily, so it shares cached answers with num_beams=1
+            key = self._answer_key(input_text, 1)
+            cached = self.inference_cache.get(key)
+            if cached is not None:
+                yield {"event": "token", "text": cached["answer"]}
+                yield {"event": "done", "answer": cached["answer"]}
+                return
+            
+            answer = []
+            for text in self.qa_generator.stream(input_text):
+                answer.append(text)
+                yield {"event": "token", "text": text}
+            self.inference_cache.put(key, {"status": "success", "answer": "".join(answer)})
+            yield {"event": "done", "answer": "".join(answer)}
+        
+        except Exception as e:
+            yield {"event": "error", "message": str(e)}
+
+    @staticmethod
+    def _answer_key(input_text, num_beams):
+        return cache_key(
+            "answer",
+            f"{QA_MODEL}/{QA_BACKEND}",
+            {"num_beams": num_beams, "max_length": ANSWER_MAX_LENGTH, "min_length": ANSWER_MIN_LENGTH},
+            text_sha256(input_text)
+        )
+
+    def _prepare_answer(self, question, context, top_k):
+        """Return (model input, sources); sources is None when the caller supplied the context"""
+        if context:
+            return f"question: {question} context: {context}", None
+        
+        self._reload_if_stale()
+        if not len(self.index):
+            raise ValueError("No pages indexed")
+        
+        prompt = f"question: {question} context: "
+        ranked = self._rank_passages(question, top_k or RAG_CANDIDATES, SEARCH_MODE, SEARCH_FUSION, HYBRID_ALPHA)
+        packed, sources = self._pack_context(ranked, QA_MAX_INPUT_TOKENS - self._count_tokens([prompt])[0])
+        if not packed:
+            raise ValueError("No relevant passages found")
+        return prompt + " ".join(packed), sources
+
+    def _pack_context(self, ranked, budget):
+        """Greedily take passages in rank order while they fit the token budget"""
+        passages = self.page_store.get_passages(pid for pid, _ in ranked)
+        pages = self.page_store.get_pages({passage["doc_id"] for passage in passages.values()})
+        
+        # Passages indexed before token counts were stored are measured now
+        missing = [
+            pid for pid, passage in passages.items()
+            if passage["token_count"] is None and passage["doc_id"] in pages
+        ]
+        if missing:
+            texts = [
+                self._passage_text(pages[passages[pid]["doc_id"]], passages[pid]["start"], passages[pid]["end"])
+                for pid in missing
+            ]
+            for pid, count in zip(missing, self._count_tokens(texts)):
+                passages[pid]["token_count"] = count
+        
+        packed = []
+        sources = []
+        for pid, score in ranked:
+            passage = passages.get(pid)
+            page = pages.get(passage["doc_id"]) if passage else None
+            if page is None:
+                continue
+            # One extra token for the separator between passages
+            cost = passage["token_count"] + 1
+            if cost > budget:
+                # A shorter passage further down may still fit
+                continue
+            budget -= cost
+            packed.append(self._passage_text(page, passage["start"], passage["end"]))
+            sources.append({
+                "title": page["title"],
+                "url": page["url"],
+                "passage_id": pid,
+                "relevance_score": score
+            })
+            if budget <= 1:
+                break
+        return packed, sources
+
+    def _count_tokens(self, texts):
+        """FLAN-T5 token counts, without special tokens"""
+        if not texts:
+            return []
+        encoded = self.qa_tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
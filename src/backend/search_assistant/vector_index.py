@@ -0,0 +1,293 @@
+"""
+Vector index
+FAISS index keyed by stable integer ids, backed by a flat, IVF or HNSW structure.
+"""
+import os
+import json
+import numpy as np
+import faiss
+
+INDEX_FILE = "index.faiss"
+EMBEDDINGS_FILE = "embeddings.npy"
+IDS_FILE = "ids.npy"
+TOMBSTONES_FILE = "tombstones.npy"
+META_FILE = "index.json"
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+# Settings baked into the built structure; the others only apply at query time
+BUILD_SETTINGS = ("index_type", "nlist", "hnsw_m", "ef_construction")
+SEARCH_SETTINGS = ("nprobe", "ef_search")
+# IVF needs enough vectors per centroid to train; smaller corpora are served by a flat index
+IVF_MIN_POINTS_PER_LIST = 39
+# Retrain IVF centroids once the corpus has grown this much since the last training
+IVF_RETRAIN_GROWTH = 4
+# Removed HNSW entries stay in the graph, filtered out at search time, until they make up
+# this share of the live entries and the graph is rebuilt
+HNSW_MAX_TOMBSTONE_RATIO = float(os.getenv("SEARCH_HNSW_MAX_TOMBSTONE_RATIO", "0.2"))
+
+
+def default_index_settings():
+    """Index settings from the environment"""
+    return {
+        "index_type": os.getenv("SEARCH_INDEX_TYPE", "flat").lower(),
+        # 0 picks 4 * sqrt(n) lists when the index is trained
+        "nlist": int(os.getenv("SEARCH_IVF_NLIST", "0")),
+        "nprobe": int(os.getenv("SEARCH_IVF_NPROBE", "16")),
+        "hnsw_m": int(os.getenv("SEARCH_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("SEARCH_HNSW_EF_CONSTRUCTION", "200")),
+        "ef_search": int(os.getenv("SEARCH_HNSW_EF_SEARCH", "64")),
+    }
+
+
+class VectorIndex:
+    def __init__(self, settings=None):
+        self.settings = dict(default_index_settings(), **(settings or {}))
+        if self.settings["index_type"] not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.settings['index_type']}")
+        self.dim = None
+        self.index = None
+        # Structure actually built; IVF degrades to flat while the corpus is too small to train
+        self.built_type = None
+        self.trained_on = 0
+        # The embedding matrix and its ids are kept alongside the FAISS index
+        self.ids = np.empty(0, dtype='int64')
+        self.embeddings = None
+        # Ids removed from `ids` but still in the HNSW graph
+        self.tombstones = np.empty(0, dtype='int64')
+        self._tombstone_selector = None
+        # Set while the index and arrays are read-only views of files in this directory
+        self.mapped_from = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def mapped(self):
+        return self.mapped_from is not None
+
+    def copy(self):
+        """A copy to modify while searches keep using this index; swap it in once updated"""
+        clone = VectorIndex(self.settings)
+        clone.dim = self.dim
+        clone.built_type = self.built_type
+        clone.trained_on = self.trained_on
+        # Arrays are replaced rather than modified in place, so they can be shared
+        clone.ids = self.ids
+        clone.embeddings = self.embeddings
+        clone.tombstones = self.tombstones
+        clone._tombstone_selector = self._tombstone_selector
+        clone.mapped_from = self.mapped_from
+        if self.index is not None:
+            # A mapped index is replaced by a private copy on its first modification anyway
+            clone.index = self.index if self.mapped else faiss.clone_index(self.index)
+        return clone
+
+    def _build(self, ids, embeddings):
+        """Build a fresh index of the configured type over the given vectors"""
+        self.dim = embeddings.shape[1]
+        index_type = self.settings["index_type"]
+        n = len(ids)
+
+        if index_type == "ivf":
+            nlist = self.settings["nlist"] or int(4 * np.sqrt(max(n, 1)))
+            nlist = min(nlist, n // IVF_MIN_POINTS_PER_LIST)
+            if nlist < 2:
+                index_type = "flat"
+
+        if index_type == "ivf":
+            quantizer = faiss.IndexFlatL2(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist)
+            index.train(embeddings)
+        elif index_type == "hnsw":
+            hnsw = faiss.IndexHNSWFlat(self.dim, self.settings["hnsw_m"])
+            hnsw.hnsw.efConstruction = self.settings["ef_construction"]
+            index = faiss.IndexIDMap2(hnsw)
+        else:
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+
+        if n:
+            index.add_with_ids(embeddings, ids)
+        self.index = index
+        self.built_type = index_type
+        self.trained_on = n if index_type == "ivf" else 0
+        self.ids = ids
+        self.embeddings = embeddings
+        self._set_tombstones(np.empty(0, dtype='int64'))
+        self.mapped_from = None
+        self._apply_search_settings()
+
+    def _ensure_writable(self):
+        """Replace a memory-mapped index with a private copy before it is modified"""
+        if not self.mapped:
+            return
+        directory = self.mapped_from
+        self.index = faiss.read_index(os.path.join(directory, INDEX_FILE))
+        self.ids = np.array(self.ids, dtype='int64')
+        self.embeddings = np.array(self.embeddings, dtype='float32')
+        self.mapped_from = None
+        self._apply_search_settings()
+
+    def add(self, ids, embeddings):
+        """Add embeddings under the given ids"""
+        if len(ids) == 0:
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        ids = np.asarray(ids, dtype='int64')
+
+        if self.index is None:
+            self._build(ids, embeddings)
+            return
+
+        all_ids = np.concatenate([self.ids, ids])
+        all_embeddings = np.concatenate([self.embeddings, embeddings])
+        # A re-added id must not stay hidden behind its tombstone
+        if self._needs_retrain(len(all_ids)) or np.isin(ids, self.tombstones).any():
+            self._build(all_ids, all_embeddings)
+            return
+
+        self._ensure_writable()
+        self.index.add_with_ids(embeddings, ids)
+        self.ids = all_ids
+        self.embeddings = all_embeddings
+
+    def remove(self, ids):
+        """Remove the entries stored under the given ids"""
+        if len(ids) == 0 or self.index is None:
+            return
+        ids = np.asarray(ids, dtype='int64')
+        keep = ~np.isin(self.ids, ids)
+
+        if self.built_type == "hnsw":
+            # HNSW graphs cannot drop nodes: hide them from searches, and rebuild from the stored
+            # vectors once too many are hidden
+            tombstones = np.union1d(self.tombstones, self.ids[~keep])
+            if len(tombstones) > HNSW_MAX_TOMBSTONE_RATIO * max(int(keep.sum()), 1):
+                self._build(np.array(self.ids[keep]), np.array(self.embeddings[keep]))
+                return
+            self._set_tombstones(tombstones)
+            self.ids = self.ids[keep]
+            self.embeddings = self.embeddings[keep]
+            return
+
+        self._ensure_writable()
+        self.index.remove_ids(ids)
+        self.ids = self.ids[keep]
+        self.embeddings = self.embeddings[keep]
+
+    def rebuild(self, settings=None):
+        """Rebuild the index from the stored vectors, optionally with new settings"""
+        if settings:
+            self.settings.update(settings)
+        if self.embeddings is not None:
+            self._build(np.array(self.ids, dtype='int64'), np.array(self.embeddings, dtype='float32'))
+
+    def apply_settings(self, settings, allow_rebuild=True):
+        """Adopt new settings; returns True when the index had to be rebuilt for them"""
+        for key in SEARCH_SETTINGS:
+            if key in settings:
+                self.settings[key] = settings[key]
+        changed = {
+            key: settings[key] for key in BUILD_SETTINGS
+            if key in settings and settings[key] != self.settings[key]
+        }
+        if not changed or not allow_rebuild:
+            if self.index is not None:
+                self._apply_search_settings()
+            return False
+        self.rebuild(changed)
+        return True
+
+    def _set_tombstones(self, tombstones):
+        self.tombstones = tombstones
+        self._tombstone_selector = None
+        if len(tombstones):
+            batch = faiss.IDSelectorBatch(len(tombstones), faiss.swig_ptr(tombstones))
+            # The Not selector does not own the batch; keep both alive with the index
+            self._tombstone_selector = (faiss.IDSelectorNot(batch), batch)
+
+    def _needs_retrain(self, total):
+        if self.settings["index_type"] != "ivf":
+            return False
+        if self.built_type != "ivf":
+            # Still flat because the corpus was too small; train as soon as it is large enough
+            return total // IVF_MIN_POINTS_PER_LIST >= 2
+        return total > self.trained_on * IVF_RETRAIN_GROWTH
+
+    def search(self, query_embeddings, top_k, nprobe=None, ef_search=None):
+        """Return (distances, ids) of the nearest entries; missing hits have id -1.
+
+        Nothing shared is modified, so concurrent searches need no lock; `nprobe` and `ef_search`
+        override the configured values for this call only.
+        """
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+        params = None
+        if self.built_type == "ivf" and nprobe:
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe
+        elif self.built_type == "hnsw" and (ef_search or self._tombstone_selector is not None):
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = ef_search or self.settings["ef_search"]
+            if self._tombstone_selector is not None:
+                params.sel = self._tombstone_selector[0]
+        if params is None:
+            return self.index.search(query_embeddings, min(top_k, len(self)))
+        return self.index.search(query_embeddings, min(top_k, len(self)), params=params)
+
+    def _apply_search_settings(self):
+        """Put the query-time settings on the FAISS index; done before the index is searched"""
+        if self.built_type == "ivf":
+            if self.index.nprobe != self.settings["nprobe"]:
+                self.index.nprobe = self.settings["nprobe"]
+        elif self.built_type == "hnsw":
+            hnsw = faiss.downcast_index(self.index.index).hnsw
+            if hnsw.efSearch != self.settings["ef_search"]:
+                hnsw.efSearch = self.settings["ef_search"]
+
+    def save(self, directory):
+        """Write the index, embedding matrix, ids and settings into `directory`"""
+        faiss.write_index(self.index, os.path.join(directory, INDEX_FILE))
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), np.asarray(self.embeddings, dtype='float32'))
+        np.save(os.path.join(directory, IDS_FILE), np.asarray(self.ids, dtype='int64'))
+        np.save(os.path.join(directory, TOMBSTONES_FILE), self.tombstones)
+        with open(os.path.join(directory, META_FILE), "w") as f:
+            json.dump({
+                "settings": self.settings,
+                "built_type": self.built_type,
+                "trained_on": self.trained_on
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load an index saved by `save`, memory-mapping it so processes share the pages"""
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        vector_index = cls(meta["settings"])
+        vector_index.built_type = meta["built_type"]
+        vector_index.trained_on = meta["trained_on"]
+
+        index_path = os.path.join(directory, INDEX_FILE)
+        vector_index.index = None
+        if mmap:
+            # IVF maps its inverted lists, flat and HNSW map their vector storage;
+            # older FAISS builds without these flags fall back to a private copy
+            flag_name = "IO_FLAG_MMAP" if vector_index.built_type == "ivf" else "IO_FLAG_MMAP_IFC"
+            if hasattr(faiss, flag_name):
+                try:
+                    vector_index.index = faiss.read_index(
+                        index_path, getattr(faiss, flag_name) | faiss.IO_FLAG_READ_ONLY
+                    )
+                except RuntimeError:
+                    vector_index.index = None
+        if vector_index.index is None:
+            vector_index.index = faiss.read_index(index_path)
+        vector_index.dim = vector_index.index.d
+
+        mmap_mode = 'r' if mmap else None
+        vector_index.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        vector_index.ids = np.load(os.path.join(directory, IDS_FILE), mmap_mode=mmap_mode)
+        tombstones_path = os.path.join(directory, TOMBSTONES_FILE)
+        if os.path.exists(tombstones_path):
+            vector_index._set_tombstones(np.load(tombstones_path))
+        vector_index.mapped_from = directory if mmap else None
+        vector_index._apply_search_settings()
+        return vector_index